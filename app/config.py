@@ -3,11 +3,71 @@ from dotenv import dotenv_values
 
 settings = {
     "ARTIFACT_DIR": ".artifact",
+    "DB_PATH": ".artifact/hn_data.duckdb",
+    "CACHE_DB_PATH": ":memory:",
     "SOURCE": "https://hacker-news.firebaseio.com/v0/",
     "HF_URL": "https://api-inference.huggingface.co/models/BAAI/bge-small-en-v1.5",
+    # Seconds before a stalled embedding request fails instead of hanging the pipeline
+    "HF_TIMEOUT": 30.0,
     "N_CLUSTERS": 5,
+    "N_CLUSTERS_AUTO": False,
+    "AUTO_K_MIN": 2,
+    "AUTO_K_MAX": 20,
+    "AUTO_K_FIT_SAMPLE": 5000,
+    "AUTO_K_SCORE_SAMPLE": 2000,
+    "AUTO_K_TIME_BUDGET": 60,
+    "AUTO_K_WORKERS": None,
+    "CLUSTER_REFINE_EVERY": 500,
+    "CLUSTER_IN_WORKER": True,
+    "CLUSTER_WINDOW_HOURS": 72,
+    "RETENTION_DAYS": 14,
+    "RETENTION_INTERVAL": 24 * 60 * 60,
+    "ARCHIVE_DIR": ".artifact/archive",
+    "SNAPSHOT_PATH": ".artifact/snapshot",
+    # Seconds between in-process snapshot exports to SNAPSHOT_PATH, 0 to disable
+    "SNAPSHOT_INTERVAL": 24 * 60 * 60,
+    "LLM_URL": "https://openrouter.ai/api/v1/chat/completions",
     "LLM_MODEL": "google/gemini-2.5-flash",
-    "HN_URL": "https://hacker-news.firebaseio.com/v0/"
+    "LLM_CONCURRENCY": 4,
+    "HN_URL": "https://hacker-news.firebaseio.com/v0/",
+    "CRAWL_LIMIT": 100,
+    "CRAWL_CONCURRENCY": 16,
+    "CRAWL_RATE_LIMIT": 25,
+    "CRAWL_MAX_RETRIES": 3,
+    # Seconds per HN request before it is retried
+    "CRAWL_TIMEOUT": 10.0,
+    "CRAWL_INCREMENTAL": True,
+    # "topstories" re-reads the front page; "updates" polls maxitem.json/updates.json
+    "CRAWL_MODE": "topstories",
+    "CRAWL_POLL_INTERVAL": 5 * 60,
+    "CRAWL_POLL_MAX_ITEMS": 5000,
+    "CRAWL_INTERVAL": 60 * 60,
+    "CRAWL_JITTER": 0.1,
+    "RECLUSTER_MIN_CHANGES": 20,
+    "RECLUSTER_MAX_INTERVAL": 6 * 60 * 60,
+    "EMBEDDING_BACKEND": "hf",
+    "EMBEDDING_BATCH_SIZE": 32,
+    "EMBEDDING_CHUNK_SIZE": 10000,
+    "EMBEDDING_STORAGE": "float32",
+    "EMBEDDING_CONCURRENCY": 2,
+    "PIPELINE_QUEUE_SIZE": 256,
+    "PIPELINE_FLUSH_INTERVAL": 1.0,
+    "PIPELINE_REPORT_INTERVAL": 10,
+    "WRITE_BATCH_SIZE": 500,
+    "DEDUP_THRESHOLD": 0.95,
+    "DEDUP_BLOCK_SIZE": 2048,
+    "DB_EXECUTOR_WORKERS": 4,
+    "CACHE_MAX_ENTRIES": 10000,
+    "CACHE_MAX_BYTES": 64 * 1024 * 1024,
+    "CACHE_DUCKDB_TIER": False,
+    "CACHE_SWEEP_INTERVAL": 60,
+    "VECTOR_INDEX_NPROBE": 16,
+    "VECTOR_INDEX_LISTS_PER_SQRT": 1.0,
+    "VECTOR_INDEX_MAX_DELTA": 10000,
+    "VECTOR_INDEX_DELTA_RATIO": 0.1,
+    "METRICS_ENABLED": True,
+    "METRICS_PATH": ".artifact/metrics.prom",
+    "METRICS_INTERVAL": 60,
 }
 
 secrets = {
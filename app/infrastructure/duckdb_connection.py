@@ -1,27 +1,134 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
 import duckdb
 
-conn = None
-
-def init_conn():
-    global conn
-    
-    if conn: return
-    
-    conn = duckdb.connect(":memory:")
-    
-    # Initialize cache table
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS cache (
-            key VARCHAR PRIMARY KEY,
-            value TEXT NOT NULL,
-            expires_at TIMESTAMP DEFAULT NULL
-        )
-    """)
-    
-    return conn
-
-def get_conn():
-    global conn
-    if not conn: return init_conn()
-    
-    return conn
+from ..config import settings
+from .metrics import register_collector
+
+
+class DuckDBConnectionManager:
+    """Single owner of one DuckDB database for the whole process.
+
+    Every thread gets its own cursor on the shared database handle. Readers
+    use it without locking, since DuckDB's MVCC gives each query a consistent
+    snapshot. Writers are serialized through one lock, so concurrent
+    transactions never conflict. A separate read_only connection is not used
+    because DuckDB refuses to open one file with two configurations in one
+    process.
+
+    The database is opened on first use, so importing modules that create
+    repositories (e.g. in spawned worker processes) does not take the file lock.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self._conn: duckdb.DuckDBPyConnection | None = None
+        self._conn_lock = threading.Lock()
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "cursors_created": 0,
+            "reads": 0,
+            "writes": 0,
+            "write_wait_seconds": 0.0,
+            "max_write_wait_seconds": 0.0,
+        }
+
+    @property
+    def conn(self) -> duckdb.DuckDBPyConnection:
+        if self._conn is None:
+            with self._conn_lock:
+                if self._conn is None:
+                    self._conn = duckdb.connect(self.db_path)
+        return self._conn
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        """Return the calling thread's cursor, creating it on first use"""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self.conn.cursor()
+            self._local.cursor = cursor
+            self._increment("cursors_created")
+        return cursor
+
+    def reader(self) -> duckdb.DuckDBPyConnection:
+        """Cursor for read-only queries; never waits for writers"""
+        self._increment("reads")
+        return self.cursor()
+
+    @contextmanager
+    def writer(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Hold the single-writer lock for the duration of the block"""
+        start = time.perf_counter()
+        with self._write_lock:
+            waited = time.perf_counter() - start
+            with self._metrics_lock:
+                self._metrics["writes"] += 1
+                self._metrics["write_wait_seconds"] += waited
+                self._metrics["max_write_wait_seconds"] = max(
+                    self._metrics["max_write_wait_seconds"], waited
+                )
+            yield self.cursor()
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            return {"db_path": self.db_path, **self._metrics}
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+
+    def _increment(self, name: str) -> None:
+        with self._metrics_lock:
+            self._metrics[name] += 1
+
+
+_managers: dict[str, DuckDBConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(db_path: str | None = None) -> DuckDBConnectionManager:
+    """Return the process-wide manager for db_path (default: DB_PATH)"""
+    db_path = db_path or settings["DB_PATH"]
+    manager = _managers.get(db_path)
+    if manager is None:
+        with _managers_lock:
+            manager = _managers.get(db_path)
+            if manager is None:
+                manager = DuckDBConnectionManager(db_path)
+                _managers[db_path] = manager
+    return manager
+
+
+def metrics() -> list[dict]:
+    """Pool metrics of every open database"""
+    return [manager.metrics() for manager in list(_managers.values())]
+
+
+def _collect() -> list[tuple[dict, dict]]:
+    samples = []
+    for manager_metrics in metrics():
+        db_path = manager_metrics.pop("db_path")
+        samples.append(({"db_path": db_path}, manager_metrics))
+    return samples
+
+
+register_collector(
+    "duckdb", _collect, counters=("cursors_created", "reads", "writes", "write_wait_seconds")
+)
+
+
+def close_all() -> None:
+    with _managers_lock:
+        for manager in _managers.values():
+            manager.close()
+        _managers.clear()
+
+
+def get_conn() -> duckdb.DuckDBPyConnection:
+    """Thread-local cursor on the cache database"""
+    return get_manager(settings["CACHE_DB_PATH"]).cursor()
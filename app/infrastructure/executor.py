@@ -0,0 +1,42 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable
+
+from ..config import settings
+
+# Short repository reads issued by bot handlers
+db_executor = ThreadPoolExecutor(
+    max_workers=settings["DB_EXECUTOR_WORKERS"], thread_name_prefix="tinysignal-db"
+)
+# Crawling and clustering; one worker so background runs never overlap
+background_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tinysignal-bg")
+
+
+async def run_blocking(
+    fn: Callable, *args, executor: ThreadPoolExecutor | None = None, **kwargs
+) -> Any:
+    """Run a blocking call off the event loop, on db_executor by default"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor or db_executor, functools.partial(fn, *args, **kwargs)
+    )
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one blocking execution"""
+
+    def __init__(self, executor: ThreadPoolExecutor | None = None) -> None:
+        self.executor = executor
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                run_blocking(fn, *args, executor=self.executor, **kwargs)
+            )
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A cancelled waiter must not cancel the shared computation
+        return await asyncio.shield(future)
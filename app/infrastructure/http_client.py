@@ -0,0 +1,86 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Async token-bucket rate limiter shared by all requests of one crawl"""
+
+    def __init__(self, rate: float, capacity: int | None = None) -> None:
+        assert rate > 0, "Rate must be positive."
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def create_async_client(max_connections: int, timeout: float = 10.0) -> httpx.AsyncClient:
+    """Create a keep-alive client whose pool matches the concurrency cap"""
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+async def request_with_retry(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    limiter: TokenBucket | None = None,
+    max_retries: int = 3,
+    backoff: float = 0.5,
+    **kwargs,
+) -> httpx.Response:
+    """Send a request, retrying transport errors and 429/5xx with exponential backoff"""
+    for attempt in range(max_retries + 1):
+        if limiter:
+            await limiter.acquire()
+        try:
+            resp = await client.request(method, url, **kwargs)
+            if resp.status_code not in RETRYABLE_STATUS_CODES:
+                resp.raise_for_status()
+                return resp
+            error = httpx.HTTPStatusError(
+                f"Retryable status {resp.status_code}", request=resp.request, response=resp
+            )
+        except httpx.TransportError as e:
+            error = e
+
+        if attempt == max_retries:
+            raise error
+        delay = backoff * (2 ** attempt) * (1 + random.random())
+        logger.warning(f"Request to {url} failed ({error}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+async def get_json_with_retry(
+    client: httpx.AsyncClient,
+    url: str,
+    limiter: TokenBucket | None = None,
+    max_retries: int = 3,
+):
+    resp = await request_with_retry(client, "GET", url, limiter=limiter, max_retries=max_retries)
+    return resp.json()
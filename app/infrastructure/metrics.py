@@ -0,0 +1,220 @@
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable
+
+from ..config import settings
+
+# Upper bounds in seconds, from a DuckDB point read to an LLM call under load
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_NAME = "tinysignal_span_seconds"
+ERRORS_NAME = "tinysignal_span_errors_total"
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+    """Cumulative latency histogram with fixed BUCKETS, safe across threads"""
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.sum += seconds
+            self.count += 1
+            self.errors += error
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf past the last bucket)"""
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        rank, seen = q * count, 0
+        for bound, n in zip(BUCKETS + (float("inf"),), counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+_histograms: dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+# name -> (collect, counter fields); collect() returns one (labels, values) pair per series
+_collectors: dict[str, tuple[Callable[[], list[tuple[dict, dict]]], frozenset[str]]] = {}
+
+
+def get_histogram(name: str) -> Histogram:
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, Histogram())
+    return histogram
+
+
+def observe(name: str, seconds: float, error: bool = False) -> None:
+    if settings["METRICS_ENABLED"]:
+        get_histogram(name).observe(seconds, error)
+
+
+class _span:
+    """Context manager observing the block's wall time; raising blocks count as errors"""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, name: str) -> None:
+        self.histogram = get_histogram(name)
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, error=exc_type is not None)
+
+
+def span(name: str):
+    """Time a block into the `name` histogram; a shared no-op when metrics are disabled"""
+    if not settings["METRICS_ENABLED"]:
+        return _NOOP
+    return _span(name)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Decorator form of span() for plain and async functions"""
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not settings["METRICS_ENABLED"]:
+                    return await fn(*args, **kwargs)
+                with _span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not settings["METRICS_ENABLED"]:
+                return fn(*args, **kwargs)
+            with _span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict[str, Histogram]:
+    with _histograms_lock:
+        return dict(sorted(_histograms.items()))
+
+
+def register_collector(
+    name: str, collect: Callable[[], list[tuple[dict, dict]]], counters: tuple[str, ...] = ()
+) -> None:
+    """Export the numeric values polled from collect() as tinysignal_<name>_<field>.
+
+    Fields listed in counters are monotonic and get a _total suffix; the rest
+    are gauges. Registering a name again replaces the previous collector.
+    """
+    _collectors[name] = (collect, frozenset(counters))
+
+
+def collect() -> dict[str, list[tuple[dict, dict]]]:
+    """Current samples of every registered collector; failing collectors are skipped"""
+    samples = {}
+    for name, (collect_fn, _) in sorted(_collectors.items()):
+        try:
+            samples[name] = [
+                (labels, {k: v for k, v in values.items() if isinstance(v, (int, float)) and not isinstance(v, bool)})
+                for labels, values in collect_fn()
+            ]
+        except Exception:
+            continue
+    return samples
+
+
+def reset() -> None:
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def render_prometheus() -> str:
+    """All histograms in the Prometheus text exposition format"""
+    lines = [
+        f"# HELP {METRIC_NAME} Wall time of instrumented pipeline stages.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    errors = [
+        f"# HELP {ERRORS_NAME} Instrumented calls that raised.",
+        f"# TYPE {ERRORS_NAME} counter",
+    ]
+    for name, histogram in snapshot().items():
+        with histogram._lock:
+            counts, total, count, n_errors = list(histogram.counts), histogram.sum, histogram.count, histogram.errors
+        cumulative = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{METRIC_NAME}_bucket{{span="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_sum{{span="{name}"}} {total}')
+        lines.append(f'{METRIC_NAME}_count{{span="{name}"}} {count}')
+        errors.append(f'{ERRORS_NAME}{{span="{name}"}} {n_errors}')
+    return "\n".join(lines + errors + _render_collectors()) + "\n"
+
+
+def _render_collectors() -> list[str]:
+    lines = []
+    for name, series in collect().items():
+        counters = _collectors[name][1]
+        fields = dict.fromkeys(field for _, values in series for field in values)
+        for field in fields:
+            is_counter = field in counters
+            metric = f"tinysignal_{name}_{field}" + ("_total" if is_counter else "")
+            lines.append(f"# TYPE {metric} {'counter' if is_counter else 'gauge'}")
+            for labels, values in series:
+                if field in values:
+                    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+                    lines.append(f"{metric}{{{label_text}}} {values[field]}" if label_text else f"{metric} {values[field]}")
+    return lines
+
+
+def write_textfile(path: str | None = None) -> str:
+    """Atomically write render_prometheus() for node_exporter's textfile collector"""
+    path = path or settings["METRICS_PATH"]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+
+def format_stats() -> str:
+    """Plain-text per-stage summary for the /stats command"""
+    histograms = snapshot()
+    lines = []
+    if histograms:
+        lines.append(f"{'stage':<36}{'count':>7}{'mean ms':>10}{'p95 ms':>9}{'errors':>8}")
+    elif settings["METRICS_ENABLED"]:
+        lines.append("No metrics recorded yet.")
+    else:
+        lines.append("Metrics are disabled.")
+    for name, histogram in histograms.items():
+        mean_ms = histogram.sum / histogram.count * 1000 if histogram.count else 0.0
+        p95_ms = histogram.quantile(0.95) * 1000
+        p95 = f"{p95_ms:.0f}" if p95_ms != float("inf") else f">{BUCKETS[-1] * 1000:.0f}"
+        lines.append(f"{name:<36}{histogram.count:>7}{mean_ms:>10.1f}{'≤' + p95:>9}{histogram.errors:>8}")
+    for name, series in collect().items():
+        for labels, values in series:
+            title = " ".join([name, *labels.values()])
+            fields = " ".join(f"{field}={value:.3f}" if isinstance(value, float) else f"{field}={value}" for field, value in values.items())
+            lines.append(f"\n{title}\n  {fields}")
+    return "\n".join(lines)
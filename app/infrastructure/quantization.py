@@ -0,0 +1,50 @@
+from typing import Iterator
+
+import numpy as np
+
+# EMBEDDING_STORAGE modes and the dtype of the codes each one stores
+STORAGE_DTYPES = {
+    "float32": np.dtype(np.float32),
+    "float16": np.dtype(np.float16),
+    "int8": np.dtype(np.int8),
+}
+
+
+def quantize(vectors: np.ndarray, storage: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """Encode float vectors as `storage` codes; returns (codes, scales).
+
+    int8 is scaled per vector: its largest absolute component maps to 127,
+    so each component is off by at most half of that vector's step. Scales
+    are None for the float modes.
+    """
+    assert storage in STORAGE_DTYPES, f"Unknown storage {storage!r}, expected one of {list(STORAGE_DTYPES)}"
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if storage != "int8":
+        return vectors.astype(STORAGE_DTYPES[storage], copy=False), None
+    scales = np.abs(vectors).max(axis=-1, initial=0.0) / 127
+    # All-zero vectors keep a unit scale so the division stays finite
+    scales = np.where(scales > 0, scales, 1).astype(np.float32)
+    codes = np.rint(vectors / scales[..., None]).astype(np.int8)
+    return codes, scales
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray | None = None) -> np.ndarray:
+    """Float32 vectors back from quantize() codes"""
+    if codes.dtype == np.int8:
+        return np.multiply(codes, scales[..., None], dtype=np.float32)
+    return codes.astype(np.float32, copy=False)
+
+
+def iter_dequantized(
+    codes: np.ndarray, scales: np.ndarray | None, block_size: int
+) -> Iterator[tuple[int, np.ndarray]]:
+    """Yield (start, float32 block) so only one block is ever dequantized at a time"""
+    for start in range(0, len(codes), block_size):
+        block_scales = None if scales is None else scales[start:start + block_size]
+        yield start, dequantize(codes[start:start + block_size], block_scales)
+
+
+def dot(codes: np.ndarray, scales: np.ndarray | None, query: np.ndarray) -> np.ndarray:
+    """Inner products of the encoded rows with one query, scaling after the product"""
+    scores = codes @ np.asarray(query, dtype=np.float32)
+    return scores if scales is None else scores * scales
@@ -1 +1,2 @@
-from .cluster import ClusterModel
\ No newline at end of file
+from .cluster import ClusterModel
+from .crawl import CrawlStatsModel
\ No newline at end of file
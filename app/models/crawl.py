@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+class StageStatsModel(BaseModel):
+    name: str
+    n_in: int = 0
+    n_out: int = 0
+    n_failed: int = 0
+    seconds: float = 0.0
+    # Depth of the queue feeding the stage, sampled on every item taken
+    max_queue_depth: int = 0
+    mean_queue_depth: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.n_out / self.seconds if self.seconds else 0.0
+
+class CrawlStatsModel(BaseModel):
+    started_at: datetime
+    finished_at: datetime | None = None
+    n_candidates: int = 0
+    n_skipped: int = 0
+    n_fetched: int = 0
+    n_inserted: int = 0
+    n_failed: int = 0
+    # Known posts whose score and descendants were updated
+    n_refreshed: int = 0
+    stages: list[StageStatsModel] = []
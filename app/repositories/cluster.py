@@ -1,39 +1,233 @@
 import os
+from datetime import datetime
+from typing import Iterator
 
 import duckdb
+import numpy as np
 
 from ..config import settings
+from ..infrastructure import duckdb_connection, metrics, quantization
+from ..models.crawl import CrawlStatsModel
+
+EMBEDDING_DIM = 384
+
+
+def _array_expr(alias: str, element_type: str = "FLOAT") -> str:
+    """SQL expression rebuilding a FLOAT[384] (or other element_type) from a transposed NumPy scan"""
+    dims = ", ".join(f"{alias}.column{i}" for i in range(EMBEDDING_DIM))
+    return f"[{dims}]::{element_type}[{EMBEDDING_DIM}]"
+
+
+def _stack_embeddings(column: np.ndarray, dtype: np.dtype = np.float32) -> np.ndarray:
+    """Stack a fetchnumpy embedding column (one array per row) into a dtype matrix"""
+    if len(column) == 0:
+        return np.empty((0, EMBEDDING_DIM), dtype=dtype)
+    stacked = np.stack(column)
+    # float16 arrives as the SMALLINT bit pattern it is stored as
+    if np.dtype(dtype) == np.float16:
+        return stacked.view(np.float16)
+    return stacked.astype(dtype, copy=False)
+
+
+def _count(value: int | None) -> int:
+    """HN score or descendants as stored in the scanned arrays, -1 for missing"""
+    return -1 if value is None else int(value)
+
+
+# Columns holding an embedding, one per EMBEDDING_STORAGE mode; each row fills
+# exactly one of them. float16 is stored as its bit pattern, DuckDB has no half type.
+_STORAGE_COLUMNS = {
+    "float32": ("embedding", "FLOAT"),
+    "float16": ("embedding_f16", "SMALLINT"),
+    "int8": ("embedding_i8", "TINYINT"),
+}
+
+
+def _embedding_columns(table: str = "hn_embeddings") -> str:
+    """Every stored representation of the embedding, for _decode_embeddings"""
+    return ", ".join(
+        f"{table}.{column}" for column in ("embedding", "embedding_f16", "embedding_i8", "embedding_scale")
+    )
+
+
+def _decode_embeddings(result: dict, storage: str = "float32") -> tuple[np.ndarray, np.ndarray | None]:
+    """Stack the embedding columns of a fetchnumpy result as `storage` codes.
+
+    Returns (codes, scales) as quantization.quantize would, so "float32"
+    yields a plain float32 matrix. Rows written in another storage mode are
+    re-encoded, which only happens after EMBEDDING_STORAGE was changed.
+    """
+    n_rows = len(result["embedding"])
+    codes = np.empty((n_rows, EMBEDDING_DIM), dtype=quantization.STORAGE_DTYPES[storage])
+    scales = np.ones(n_rows, dtype=np.float32) if storage == "int8" else None
+    for stored, (column, _) in _STORAGE_COLUMNS.items():
+        # NULLs come back masked; a column without NULLs is a plain array
+        rows = ~np.ma.getmaskarray(result[column])
+        if not rows.any():
+            continue
+        stored_codes = _stack_embeddings(np.ma.getdata(result[column])[rows], quantization.STORAGE_DTYPES[stored])
+        stored_scales = np.ma.getdata(result["embedding_scale"])[rows].astype(np.float32) if stored == "int8" else None
+        if stored != storage:
+            stored_codes, stored_scales = quantization.quantize(
+                quantization.dequantize(stored_codes, stored_scales), storage
+            )
+        codes[rows] = stored_codes
+        if scales is not None:
+            scales[rows] = stored_scales
+    return codes, scales
+
+
+# Tables in a snapshot, parents before the tables referencing them
+SNAPSHOT_TABLES = [
+    "hn_embeddings",
+    "hn_clusters",
+    "hn_cluster_titles",
+    "hn_cluster_centroids",
+    "hn_duplicates",
+]
+# Sequences backing the id columns of snapshot tables
+_SNAPSHOT_SEQUENCES = {
+    "hn_embeddings": "embedding_table_id_sequence",
+    "hn_clusters": "cluster_table_id_sequence",
+}
+
+def _not_duplicate(column: str, since: datetime | None) -> str:
+    """Filter on column keeping posts that are not a near-duplicate of an earlier post.
+
+    With since, a duplicate counts only while its canonical is created at or
+    after since, so the clustering window never loses a story to a canonical
+    outside it. Takes since as one more parameter.
+    """
+    window = """
+        AND canonical_id IN (SELECT id FROM hn_embeddings WHERE created_at >= ?)
+    """ if since else ""
+    return f"""
+    AND {column} NOT IN (
+        SELECT hn_embedding_id FROM hn_duplicates WHERE canonical_id <> hn_embedding_id
+        {window}
+    )
+    """
 
 
 class ClusterRepository:
     def __init__(
         self, 
-        db_path: str = f"{settings['ARTIFACT_DIR']}/hn_data.duckdb"
+        db_path: str = settings["DB_PATH"]
     ) -> None:
         self.db_path = db_path
-        self.conn = duckdb.connect(self.db_path)
-        
+        # Repositories on the same file share one process-wide database handle
+        self.manager = duckdb_connection.get_manager(db_path)
+
+    @property
+    def conn(self) -> duckdb.DuckDBPyConnection:
+        """The calling thread's cursor"""
+        return self.manager.cursor()
+
     def is_persistent_path_exists(self):
         return os.path.exists(self.db_path)
 
-    def _tuple_to_dict(
-        self, tuple_data: tuple, keys: list | None = None
-    ) -> dict:
-        if not keys: 
-            keys = ["id", "title", "url", "embedding", "hn_post_id", "created_at"]
-        return dict(zip(keys, tuple_data))
-    
-    def get_records(self) -> list[dict]:
-        query = """
-        SELECT * FROM hn_embeddings
+    def iter_compact_embedding_chunks(
+        self,
+        chunk_size: int | None = None,
+        max_id: int | None = None,
+        min_id: int = 0,
+        canonical_only: bool = False,
+        since: datetime | None = None,
+        backend: str | None = None,
+        storage: str = "float32",
+    ) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray | None]]:
+        """Yield (ids, codes, scales) chunks with min_id < id <= max_id, ordered by id.
+
+        Embeddings come back encoded as `storage` (see quantization.quantize).
+        With canonical_only=True, posts recorded as near-duplicates are skipped;
+        since and backend restrict the result to posts created at or after
+        since and embedded by backend.
         """
-        cursor = self.conn.cursor()
-        results = cursor.execute(query).fetchall()
-        return [self._tuple_to_dict(result) for result in results]
-    
+        chunk_size = chunk_size or settings["EMBEDDING_CHUNK_SIZE"]
+        query = f"""
+        SELECT id, {_embedding_columns()} FROM hn_embeddings
+        WHERE id > ? AND id <= ?
+        {"AND created_at >= ?" if since else ""}
+        {"AND embedding_backend = ?" if backend else ""}
+        {_not_duplicate("id", since) if canonical_only else ""}
+        ORDER BY id
+        LIMIT ?
+        """
+        cursor = self.manager.reader()
+        if max_id is None:
+            max_id = cursor.execute("SELECT max(id) FROM hn_embeddings").fetchone()[0]
+        last_id = min_id
+        while max_id is not None and last_id < max_id:
+            params = (
+                [last_id, max_id] + ([since] if since else []) + ([backend] if backend else [])
+                + ([since] if since and canonical_only else []) + [chunk_size]
+            )
+            result = cursor.execute(query, params).fetchnumpy()
+            ids = result["id"]
+            if len(ids) == 0:
+                break
+            # Each row arrives as one array; stacking is a single C-level copy
+            yield (ids, *_decode_embeddings(result, storage))
+            last_id = int(ids[-1])
+
+    def iter_embedding_chunks(
+        self,
+        chunk_size: int | None = None,
+        max_id: int | None = None,
+        min_id: int = 0,
+        canonical_only: bool = False,
+        since: datetime | None = None,
+        backend: str | None = None,
+    ) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        """Yield (ids, float32 matrix) chunks, see iter_compact_embedding_chunks"""
+        for ids, embeddings, _ in self.iter_compact_embedding_chunks(
+            chunk_size, max_id, min_id, canonical_only=canonical_only, since=since, backend=backend
+        ):
+            yield ids, embeddings
+
+    def get_compact_embedding_matrix(
+        self,
+        chunk_size: int | None = None,
+        canonical_only: bool = False,
+        since: datetime | None = None,
+        backend: str | None = None,
+        storage: str = "float32",
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        """Return (ids, codes, scales) where codes is a contiguous (n, 384) matrix of `storage` codes"""
+        cursor = self.manager.reader()
+        n_rows, max_id = cursor.execute("SELECT count(*), max(id) FROM hn_embeddings").fetchone()
+        ids = np.empty(n_rows, dtype=np.int64)
+        codes = np.empty((n_rows, EMBEDDING_DIM), dtype=quantization.STORAGE_DTYPES[storage])
+        scales = np.empty(n_rows, dtype=np.float32) if storage == "int8" else None
+        offset = 0
+        for chunk_ids, chunk_codes, chunk_scales in self.iter_compact_embedding_chunks(
+            chunk_size, max_id=max_id, canonical_only=canonical_only, since=since, backend=backend,
+            storage=storage,
+        ):
+            # Rows deleted or filtered out can only shrink the result
+            ids[offset:offset + len(chunk_ids)] = chunk_ids
+            codes[offset:offset + len(chunk_ids)] = chunk_codes
+            if scales is not None:
+                scales[offset:offset + len(chunk_ids)] = chunk_scales
+            offset += len(chunk_ids)
+        return ids[:offset], codes[:offset], None if scales is None else scales[:offset]
+
+    def get_embedding_matrix(
+        self,
+        chunk_size: int | None = None,
+        canonical_only: bool = False,
+        since: datetime | None = None,
+        backend: str | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return (ids, embeddings) where embeddings is a contiguous float32 (n, 384) matrix"""
+        ids, embeddings, _ = self.get_compact_embedding_matrix(
+            chunk_size, canonical_only=canonical_only, since=since, backend=backend
+        )
+        return ids, embeddings
+
     def create_cluster_table(self) -> None:
         query = """
-        CREATE SEQUENCE cluster_table_id_sequence START 1;
+        CREATE SEQUENCE IF NOT EXISTS cluster_table_id_sequence START 1;
 
         CREATE TABLE IF NOT EXISTS hn_clusters (
             id BIGINT PRIMARY KEY DEFAULT nextval('cluster_table_id_sequence'),
@@ -41,21 +235,26 @@ class ClusterRepository:
             cluster_idx INTEGER
         )
         """
-        self.conn.execute(query)
+        with self.manager.writer() as cursor:
+            cursor.execute(query)
     
     def create_cluster_title_table(self) -> None:
         query = """
         CREATE TABLE IF NOT EXISTS hn_cluster_titles (
             hn_cluster_idx BIGINT PRIMARY KEY,
-            title VARCHAR(255)
-        )
+            title VARCHAR(255),
+            membership_hash VARCHAR
+        );
+
+        ALTER TABLE hn_cluster_titles ADD COLUMN IF NOT EXISTS membership_hash VARCHAR;
         """
-        self.conn.execute(query)
+        with self.manager.writer() as cursor:
+            cursor.execute(query)
 
     def create_embeddings_table(self) -> None:
         query = \
         """
-        CREATE SEQUENCE embedding_table_id_sequence START 1;
+        CREATE SEQUENCE IF NOT EXISTS embedding_table_id_sequence START 1;
 
         CREATE TABLE IF NOT EXISTS hn_embeddings (
             id BIGINT PRIMARY KEY DEFAULT nextval('embedding_table_id_sequence'),
@@ -63,111 +262,761 @@ class ClusterRepository:
             url VARCHAR(255),
             embedding FLOAT[384],
             hn_post_id BIGINT,
-            created_at TIMESTAMP
+            created_at TIMESTAMP,
+            embedding_backend VARCHAR DEFAULT 'hf',
+            embedding_f16 SMALLINT[384],
+            embedding_i8 TINYINT[384],
+            embedding_scale FLOAT,
+            score INTEGER,
+            descendants INTEGER
+        );
+
+        ALTER TABLE hn_embeddings ADD COLUMN IF NOT EXISTS embedding_backend VARCHAR DEFAULT 'hf';
+        ALTER TABLE hn_embeddings ADD COLUMN IF NOT EXISTS embedding_f16 SMALLINT[384];
+        ALTER TABLE hn_embeddings ADD COLUMN IF NOT EXISTS embedding_i8 TINYINT[384];
+        ALTER TABLE hn_embeddings ADD COLUMN IF NOT EXISTS embedding_scale FLOAT;
+        ALTER TABLE hn_embeddings ADD COLUMN IF NOT EXISTS score INTEGER;
+        ALTER TABLE hn_embeddings ADD COLUMN IF NOT EXISTS descendants INTEGER;
+        """
+        with self.manager.writer() as cursor:
+            cursor.execute(query)
+
+    def create_cluster_centroids_table(self) -> None:
+        query = """
+        CREATE TABLE IF NOT EXISTS hn_cluster_centroids (
+            cluster_idx INTEGER PRIMARY KEY,
+            centroid FLOAT[384],
+            n_members BIGINT,
+            needs_retitle BOOLEAN DEFAULT TRUE,
+            updated_at TIMESTAMP,
+            embedding_backend VARCHAR DEFAULT 'hf'
+        );
+
+        ALTER TABLE hn_cluster_centroids ADD COLUMN IF NOT EXISTS embedding_backend VARCHAR DEFAULT 'hf';
+        """
+        with self.manager.writer() as cursor:
+            cursor.execute(query)
+
+    def create_crawl_runs_table(self) -> None:
+        """Crawl history, plus the key/value state polling resumes from"""
+        query = """
+        CREATE SEQUENCE IF NOT EXISTS crawl_run_id_sequence START 1;
+
+        CREATE TABLE IF NOT EXISTS hn_crawl_runs (
+            id BIGINT PRIMARY KEY DEFAULT nextval('crawl_run_id_sequence'),
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            n_candidates INTEGER,
+            n_skipped INTEGER,
+            n_fetched INTEGER,
+            n_inserted INTEGER,
+            n_failed INTEGER,
+            n_refreshed INTEGER DEFAULT 0
+        );
+
+        ALTER TABLE hn_crawl_runs ADD COLUMN IF NOT EXISTS n_refreshed INTEGER DEFAULT 0;
+
+        CREATE TABLE IF NOT EXISTS hn_crawl_state (
+            key VARCHAR PRIMARY KEY,
+            value BIGINT
+        );
+        """
+        with self.manager.writer() as cursor:
+            cursor.execute(query)
+
+    def create_duplicates_table(self) -> None:
+        """Dedup result per embedding; canonical posts point to themselves"""
+        query = """
+        CREATE TABLE IF NOT EXISTS hn_duplicates (
+            hn_embedding_id BIGINT PRIMARY KEY,
+            canonical_id BIGINT,
+            similarity FLOAT
         )
         """
-        self.conn.execute(query)
+        with self.manager.writer() as cursor:
+            cursor.execute(query)
 
-    def insert_to_cluster_table(self, data: list[dict]) -> None:
+    def create_indexes(self) -> None:
+        query = """
+        CREATE INDEX IF NOT EXISTS hn_embeddings_hn_post_id_idx ON hn_embeddings(hn_post_id);
+        CREATE INDEX IF NOT EXISTS hn_embeddings_created_at_idx ON hn_embeddings(created_at);
+        """
+        with self.manager.writer() as cursor:
+            cursor.execute(query)
+
+    @metrics.timed("db.bulk_insert_to_cluster_table")
+    def bulk_insert_to_cluster_table(
+        self, embedding_ids: np.ndarray, cluster_idxs: np.ndarray, replace: bool = False
+    ) -> None:
+        """Insert cluster assignments for many embeddings in one transaction.
+
+        With replace=True the existing assignments are swapped out atomically,
+        so readers never observe an empty hn_clusters table.
+        """
+        # Scanned by DuckDB as tables, see bulk_insert_into_embeddings_table
+        embedding_ids = np.asarray(embedding_ids, dtype=np.int64)
+        cluster_idxs = np.asarray(cluster_idxs, dtype=np.int32)
         query = """
         INSERT INTO hn_clusters (hn_embedding_id, cluster_idx)
-        VALUES (?, ?)
+        SELECT e.column0, c.column0 FROM embedding_ids e POSITIONAL JOIN cluster_idxs c
         """
-        cursor = self.conn.cursor()
-        for record in data:
-            cursor.execute(query, [record["id"], record["cluster_idx"]])
-        self.conn.commit()
+        with self.manager.writer() as cursor:
+            cursor.begin()
+            try:
+                if replace:
+                    cursor.execute("DELETE FROM hn_clusters")
+                cursor.execute(query)
+                cursor.commit()
+            except Exception:
+                cursor.rollback()
+                raise
+
+    def get_cluster_assignments(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return (embedding_ids, cluster_idxs) ordered by embedding id"""
+        query = """
+        SELECT hn_embedding_id, cluster_idx FROM hn_clusters
+        ORDER BY hn_embedding_id
+        """
+        cursor = self.manager.reader()
+        result = cursor.execute(query).fetchnumpy()
+        return result["hn_embedding_id"].astype(np.int64), result["cluster_idx"].astype(np.int32)
+
+    def get_unclustered_embedding_matrix(
+        self, since: datetime | None = None, backend: str | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return (ids, embeddings) of posts that have no cluster assignment yet"""
+        query = f"""
+        SELECT hn_embeddings.id, {_embedding_columns()} FROM hn_embeddings
+        LEFT JOIN hn_clusters ON hn_embeddings.id = hn_clusters.hn_embedding_id
+        WHERE hn_clusters.hn_embedding_id IS NULL
+        {"AND hn_embeddings.created_at >= ?" if since else ""}
+        {"AND hn_embeddings.embedding_backend = ?" if backend else ""}
+        {_not_duplicate("hn_embeddings.id", since)}
+        ORDER BY hn_embeddings.id
+        """
+        params = ([since] if since else []) + ([backend] if backend else []) + ([since] if since else [])
+        cursor = self.manager.reader()
+        result = cursor.execute(query, params).fetchnumpy()
+        return result["id"].astype(np.int64), _decode_embeddings(result)[0]
+
+    def count_pending_cluster_changes(self, since: datetime | None = None, backend: str | None = None) -> int:
+        """Count the posts a clustering run would touch.
+
+        These are unclustered canonical posts created since `since`, plus
+        clustered posts that have fallen out of the window.
+        """
+        query = f"""
+        SELECT (
+            SELECT count(*) FROM hn_embeddings
+            LEFT JOIN hn_clusters ON hn_embeddings.id = hn_clusters.hn_embedding_id
+            WHERE hn_clusters.hn_embedding_id IS NULL
+            {"AND hn_embeddings.created_at >= ?" if since else ""}
+            {"AND hn_embeddings.embedding_backend = ?" if backend else ""}
+            {_not_duplicate("hn_embeddings.id", since)}
+        ) + (
+            SELECT count(*) FROM hn_clusters
+            JOIN hn_embeddings ON hn_embeddings.id = hn_clusters.hn_embedding_id
+            WHERE {"hn_embeddings.created_at < ?" if since else "false"}
+        )
+        """
+        params = ([since] if since else []) + ([backend] if backend else []) + ([since] if since else []) * 2
+        cursor = self.manager.reader()
+        return cursor.execute(query, params).fetchone()[0]
+
+    def get_cluster_assignments_before(
+        self, before: datetime
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (embedding_ids, cluster_idxs, embeddings) of clustered posts created before `before`"""
+        query = f"""
+        SELECT hn_embeddings.id, hn_clusters.cluster_idx, {_embedding_columns()}
+        FROM hn_clusters
+        INNER JOIN hn_embeddings ON hn_embeddings.id = hn_clusters.hn_embedding_id
+        WHERE hn_embeddings.created_at < ?
+        ORDER BY hn_embeddings.id
+        """
+        cursor = self.manager.reader()
+        result = cursor.execute(query, [before]).fetchnumpy()
+        return (
+            result["id"].astype(np.int64),
+            result["cluster_idx"].astype(np.int32),
+            _decode_embeddings(result)[0],
+        )
+
+    @metrics.timed("db.delete_cluster_assignments")
+    def delete_cluster_assignments(self, embedding_ids: np.ndarray) -> None:
+        # Scanned by DuckDB as a table, see bulk_insert_into_embeddings_table
+        embedding_ids = np.asarray(embedding_ids, dtype=np.int64)
+        query = """
+        DELETE FROM hn_clusters WHERE hn_embedding_id IN (SELECT column0 FROM embedding_ids)
+        """
+        with self.manager.writer() as cursor:
+            cursor.execute(query)
+
+    def get_centroids(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (cluster_idxs, float32 centroids, member counts) ordered by cluster_idx"""
+        query = """
+        SELECT cluster_idx, centroid, n_members FROM hn_cluster_centroids
+        ORDER BY cluster_idx
+        """
+        cursor = self.manager.reader()
+        result = cursor.execute(query).fetchnumpy()
+        return (
+            result["cluster_idx"].astype(np.int32),
+            _stack_embeddings(result["centroid"]),
+            result["n_members"].astype(np.int64),
+        )
+
+    @metrics.timed("db.save_centroids")
+    def save_centroids(
+        self,
+        cluster_idxs: np.ndarray,
+        centroids: np.ndarray,
+        n_members: np.ndarray,
+        replace: bool = False,
+        backend: str | None = None,
+    ) -> None:
+        """Upsert centroids; replace=True drops centroids that are not in cluster_idxs.
+
+        backend tags the centroids with the embedding backend they were fitted on;
+        when omitted the stored tag is kept.
+        """
+        cluster_idxs = np.asarray(cluster_idxs, dtype=np.int32)
+        n_members = np.asarray(n_members, dtype=np.int64)
+        # Transposed so that every dimension becomes one scanned column
+        centroids = np.ascontiguousarray(np.asarray(centroids, dtype=np.float32).T)
+        query = f"""
+        INSERT INTO hn_cluster_centroids (cluster_idx, centroid, n_members, updated_at, embedding_backend)
+        SELECT i.column0, {_array_expr("c")}, n.column0, now(), coalesce(?, 'hf')
+        FROM cluster_idxs i
+        POSITIONAL JOIN n_members n
+        POSITIONAL JOIN centroids c
+        ON CONFLICT (cluster_idx)
+        DO UPDATE SET
+            centroid = EXCLUDED.centroid,
+            n_members = EXCLUDED.n_members,
+            updated_at = EXCLUDED.updated_at,
+            embedding_backend = coalesce(?, hn_cluster_centroids.embedding_backend)
+        """
+        with self.manager.writer() as cursor:
+            cursor.begin()
+            try:
+                if replace:
+                    cursor.execute("DELETE FROM hn_cluster_centroids")
+                cursor.execute(query, [backend, backend])
+                cursor.commit()
+            except Exception:
+                cursor.rollback()
+                raise
+
+    def get_centroid_backends(self) -> set[str]:
+        query = """
+        SELECT DISTINCT embedding_backend FROM hn_cluster_centroids
+        """
+        cursor = self.manager.reader()
+        return {row[0] for row in cursor.execute(query).fetchall()}
+
+    def mark_clusters_for_retitle(self, cluster_idxs: list[int], needs_retitle: bool = True) -> None:
+        if not cluster_idxs:
+            return
+        query = """
+        UPDATE hn_cluster_centroids SET needs_retitle = ?
+        WHERE cluster_idx IN (SELECT unnest(?::INTEGER[]))
+        """
+        with self.manager.writer() as cursor:
+            cursor.execute(query, [needs_retitle, [int(idx) for idx in cluster_idxs]])
 
+    def get_clusters_to_retitle(self) -> list[int]:
+        query = """
+        SELECT cluster_idx FROM hn_cluster_centroids
+        WHERE needs_retitle
+        ORDER BY cluster_idx
+        """
+        cursor = self.manager.reader()
+        results = cursor.execute(query).fetchall()
+        return [row[0] for row in results]
+
+    @metrics.timed("db.insert_to_cluster_title_table")
     def insert_to_cluster_title_table(self, data: list) -> None:
+        """Upsert [cluster_idx, title] or [cluster_idx, title, membership_hash] items"""
         query = """
-        INSERT INTO hn_cluster_titles(hn_cluster_idx, title)
-        VALUES (?, ?)
+        INSERT INTO hn_cluster_titles(hn_cluster_idx, title, membership_hash)
+        VALUES (?, ?, ?)
         ON CONFLICT (hn_cluster_idx)
-        DO UPDATE SET title = EXCLUDED.title
+        DO UPDATE SET title = EXCLUDED.title, membership_hash = EXCLUDED.membership_hash
         """
-        cursor = self.conn.cursor()
-        for item in data:
-            cursor.execute(query, [item[0], item[1]])
-        self.conn.commit()
+        with self.manager.writer() as cursor:
+            for item in data:
+                cursor.execute(query, [item[0], item[1], item[2] if len(item) > 2 else None])
+
+    def get_titles_by_membership_hash(self, membership_hashes: list[str]) -> dict[str, str]:
+        if not membership_hashes:
+            return {}
+        query = """
+        SELECT membership_hash, title FROM hn_cluster_titles
+        WHERE list_contains(?::VARCHAR[], membership_hash)
+        """
+        cursor = self.manager.reader()
+        results = cursor.execute(query, [membership_hashes]).fetchall()
+        return {row[0]: row[1] for row in results}
 
     def get_cluster_titles(self) -> list[dict]:
         query = """
-        SELECT * FROM hn_cluster_titles
+        SELECT hn_cluster_idx, title FROM hn_cluster_titles
         """
-        cursor = self.conn.cursor()
+        cursor = self.manager.reader()
         results = cursor.execute(query).fetchall()
         return [{"hn_cluster_idx": row[0], "title": row[1]} for row in results]
 
     def clear_cluster_titles(self) -> None:
         query = "DELETE FROM hn_cluster_titles"
-        cursor = self.conn.cursor()
-        cursor.execute(query)
-        self.conn.commit()
+        with self.manager.writer() as cursor:
+            cursor.execute(query)
 
     def clear_cluster_table(self) -> None:
         query = "DELETE FROM hn_clusters"
-        cursor = self.conn.cursor()
-        cursor.execute(query)
-        self.conn.commit()
+        with self.manager.writer() as cursor:
+            cursor.execute(query)
+
+    @metrics.timed("db.bulk_insert_into_embeddings_table")
+    def bulk_insert_into_embeddings_table(self, data: list[dict], backend: str = "hf") -> int:
+        """Insert a batch of posts in one statement and one transaction.
 
-    def insert_into_embeddings_table(self, data: dict) -> None:
-        check_query = """
-        SELECT * FROM hn_embeddings WHERE hn_post_id = ?
+        Every row is tagged with the embedding backend that produced it.
+        Posts whose hn_post_id already exists are skipped. Returns the number
+        of inserted rows.
         """
-        cursor = self.conn.cursor()
-        existed_record = cursor.execute(check_query, [data["hn_post_id"]]).fetchall()
-        if len(existed_record) > 0:
-            return
+        # Keep the first occurrence of each post so the batch itself has no repeats
+        seen_post_ids = set()
+        unique_data = []
+        for record in data:
+            if record["hn_post_id"] in seen_post_ids:
+                continue
+            seen_post_ids.add(record["hn_post_id"])
+            unique_data.append(record)
+        if not unique_data:
+            return 0
+
+        # Columns are handed to DuckDB as NumPy arrays, which it scans by
+        # variable name; binding 384 Python floats per row as parameters
+        # costs far more than the insert itself.
+        # object, not str: a str array would store a missing title or url as 'None' instead of NULL
+        titles = np.array([record["title"] for record in unique_data], dtype=object)
+        urls = np.array([record["url"] for record in unique_data], dtype=object)
+        hn_post_ids = np.array([record["hn_post_id"] for record in unique_data], dtype=np.int64)
+        # -1 stands in for NULL: posts from snapshots or benchmarks may have no counts
+        scores = np.array([_count(record.get("score")) for record in unique_data], dtype=np.int64)
+        descendants = np.array([_count(record.get("descendants")) for record in unique_data], dtype=np.int64)
+        created_ats = np.array([record["created_at"] for record in unique_data], dtype="datetime64[us]")
+        storage = settings["EMBEDDING_STORAGE"]
+        column, element_type = _STORAGE_COLUMNS[storage]
+        codes, scales = quantization.quantize(
+            np.asarray([record["embedding"] for record in unique_data], dtype=np.float32), storage
+        )
+        assert codes.shape[1] == EMBEDDING_DIM, f"Expected {EMBEDDING_DIM}-d embeddings, Got: {codes.shape[1]}"
+        if storage == "float16":
+            codes = codes.view(np.int16)
+        # Transposed so that every embedding dimension becomes one scanned column
+        embeddings = np.ascontiguousarray(codes.T)
+        if scales is None:
+            scales = np.full(len(unique_data), np.nan, dtype=np.float32)
+
+        query = f"""
+        INSERT INTO hn_embeddings(
+            title, url, {column}, embedding_scale, hn_post_id, created_at, embedding_backend, score, descendants
+        )
+        SELECT t.column0, u.column0, {_array_expr("e", element_type)}, nullif(s.column0, 'NaN'), p.column0, c.column0, ?,
+            nullif(sc.column0, -1), nullif(d.column0, -1)
+        FROM titles t
+        POSITIONAL JOIN urls u
+        POSITIONAL JOIN hn_post_ids p
+        POSITIONAL JOIN created_ats c
+        POSITIONAL JOIN scales s
+        POSITIONAL JOIN scores sc
+        POSITIONAL JOIN descendants d
+        POSITIONAL JOIN embeddings e
+        -- Not NOT IN: a single NULL hn_post_id would make it match no row at all
+        WHERE NOT EXISTS (SELECT 1 FROM hn_embeddings existing WHERE existing.hn_post_id = p.column0)
+        """
+        with self.manager.writer() as cursor:
+            cursor.begin()
+            try:
+                result = cursor.execute(query, [backend]).fetchone()
+                cursor.commit()
+            except Exception:
+                cursor.rollback()
+                raise
+            return result[0] if result else 0
+
+    def get_undeduplicated_embedding_matrix(
+        self, backend: str, storage: str = "float32", since: datetime | None = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        """Return (ids, codes, scales) of posts from backend the dedup stage has not seen yet.
 
+        With since, only posts created at or after since are returned.
+        """
+        query = f"""
+        SELECT id, {_embedding_columns()} FROM hn_embeddings
+        WHERE id NOT IN (SELECT hn_embedding_id FROM hn_duplicates)
+        AND embedding_backend = ?
+        {"AND created_at >= ?" if since else ""}
+        ORDER BY id
+        """
+        cursor = self.manager.reader()
+        result = cursor.execute(query, [backend] + ([since] if since else [])).fetchnumpy()
+        return (result["id"].astype(np.int64), *_decode_embeddings(result, storage))
+
+    def get_canonical_embedding_matrix(
+        self, backend: str, storage: str = "float32", since: datetime | None = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        """Return (ids, codes, scales) of backend's canonical representatives, ordered by id.
+
+        With since, only canonicals created at or after since are returned.
+        """
+        query = f"""
+        SELECT hn_embeddings.id, {_embedding_columns()} FROM hn_embeddings
+        INNER JOIN hn_duplicates ON hn_duplicates.hn_embedding_id = hn_embeddings.id
+        WHERE hn_duplicates.canonical_id = hn_duplicates.hn_embedding_id
+        AND hn_embeddings.embedding_backend = ?
+        {"AND hn_embeddings.created_at >= ?" if since else ""}
+        ORDER BY hn_embeddings.id
+        """
+        cursor = self.manager.reader()
+        result = cursor.execute(query, [backend] + ([since] if since else [])).fetchnumpy()
+        return (result["id"].astype(np.int64), *_decode_embeddings(result, storage))
+
+    @metrics.timed("db.mark_canonical_before")
+    def mark_canonical_before(self, backend: str, before: datetime) -> int:
+        """Record unseen posts from backend created before `before` as their own canonical"""
         query = """
-        INSERT INTO hn_embeddings(title, url, embedding, hn_post_id, created_at)
-        VALUES (?, ?, ?, ?, ?)
+        INSERT INTO hn_duplicates (hn_embedding_id, canonical_id, similarity)
+        SELECT id, id, 1.0 FROM hn_embeddings
+        WHERE id NOT IN (SELECT hn_embedding_id FROM hn_duplicates)
+        AND embedding_backend = ?
+        AND created_at < ?
         """
-        cursor.execute(query, [
-            data["title"], 
-            data["url"], 
-            data["embedding"], 
-            data["hn_post_id"], 
-            data["created_at"]
-        ])
-        self.conn.commit()
+        with self.manager.writer() as cursor:
+            result = cursor.execute(query, [backend, before]).fetchone()
+        return result[0] if result else 0
+
+    @metrics.timed("db.save_duplicates")
+    def save_duplicates(
+        self,
+        embedding_ids: np.ndarray,
+        canonical_ids: np.ndarray,
+        similarities: np.ndarray,
+        since: datetime | None = None,
+    ) -> None:
+        """Record dedup results and drop cluster assignments of the new duplicates.
 
-    def get_clusters(self) -> list[dict]:
+        With since, posts whose canonical was created before since keep their
+        assignment, see _not_duplicate.
+        """
+        # Scanned by DuckDB as tables, see bulk_insert_into_embeddings_table
+        embedding_ids = np.asarray(embedding_ids, dtype=np.int64)
+        canonical_ids = np.asarray(canonical_ids, dtype=np.int64)
+        similarities = np.asarray(similarities, dtype=np.float32)
         query = """
-        SELECT * FROM hn_clusters
+        INSERT OR REPLACE INTO hn_duplicates (hn_embedding_id, canonical_id, similarity)
+        SELECT e.column0, c.column0, s.column0
+        FROM embedding_ids e
+        POSITIONAL JOIN canonical_ids c
+        POSITIONAL JOIN similarities s
         """
-        cursor = self.conn.cursor()
+        with self.manager.writer() as cursor:
+            cursor.begin()
+            try:
+                cursor.execute(query)
+                cursor.execute(f"""
+                DELETE FROM hn_clusters
+                WHERE hn_embedding_id IN (SELECT column0 FROM embedding_ids)
+                AND NOT (true {_not_duplicate("hn_embedding_id", since)})
+                """, [since] if since else [])
+                cursor.commit()
+            except Exception:
+                cursor.rollback()
+                raise
+
+    def export_embeddings_before(self, before: datetime, path: str) -> int:
+        """Write posts created before `before` to Parquet under path, partitioned by month"""
+        query = """
+        COPY (
+            SELECT *, strftime(created_at, '%Y-%m') AS created_month
+            FROM hn_embeddings
+            WHERE created_at < ?
+        ) TO '{path}' (
+            FORMAT PARQUET, PARTITION_BY (created_month), FILENAME_PATTERN 'part_{{uuid}}', OVERWRITE_OR_IGNORE
+        )
+        """.format(path=path.replace("'", "''"))
+        cursor = self.manager.reader()
+        result = cursor.execute(query, [before]).fetchone()
+        return result[0] if result else 0
+
+    def export_clusters_before(self, before: datetime, path: str) -> int:
+        """Write cluster rows of posts created before `before` to Parquet under path"""
+        query = """
+        COPY (
+            SELECT hn_clusters.*, strftime(hn_embeddings.created_at, '%Y-%m') AS created_month
+            FROM hn_clusters
+            INNER JOIN hn_embeddings ON hn_embeddings.id = hn_clusters.hn_embedding_id
+            WHERE hn_embeddings.created_at < ?
+        ) TO '{path}' (
+            FORMAT PARQUET, PARTITION_BY (created_month), FILENAME_PATTERN 'part_{{uuid}}', OVERWRITE_OR_IGNORE
+        )
+        """.format(path=path.replace("'", "''"))
+        cursor = self.manager.reader()
+        result = cursor.execute(query, [before]).fetchone()
+        return result[0] if result else 0
+
+    @metrics.timed("db.delete_embeddings_before")
+    def delete_embeddings_before(self, before: datetime) -> int:
+        """Delete posts created before `before` with their cluster and dedup rows.
+
+        Dedup rows pointing at a deleted canonical are dropped too, so those
+        posts are compared again on the next dedup run.
+        """
+        with self.manager.writer() as cursor:
+            cursor.begin()
+            try:
+                cursor.execute("""
+                DELETE FROM hn_clusters WHERE hn_embedding_id IN (
+                    SELECT id FROM hn_embeddings WHERE created_at < ?
+                )
+                """, [before])
+                cursor.execute("""
+                DELETE FROM hn_duplicates
+                WHERE hn_embedding_id IN (SELECT id FROM hn_embeddings WHERE created_at < ?)
+                OR canonical_id IN (SELECT id FROM hn_embeddings WHERE created_at < ?)
+                """, [before, before])
+                cursor.commit()
+            except Exception:
+                cursor.rollback()
+                raise
+            # DuckDB checks foreign keys against the committed state, so the
+            # referenced rows can only go in a second transaction
+            result = cursor.execute("DELETE FROM hn_embeddings WHERE created_at < ?", [before]).fetchone()
+            # Lets later inserts reuse the freed blocks instead of growing the file
+            cursor.execute("CHECKPOINT")
+        return result[0] if result else 0
+
+    def count_embeddings(self) -> int:
+        cursor = self.manager.reader()
+        return cursor.execute("SELECT count(*) FROM hn_embeddings").fetchone()[0]
+
+    def count_snapshot_rows(self) -> dict[str, int]:
+        """Row count of every snapshot table"""
+        query = " UNION ALL ".join(f"SELECT '{table}', count(*) FROM {table}" for table in SNAPSHOT_TABLES)
+        cursor = self.manager.reader()
+        return dict(cursor.execute(query).fetchall())
+
+    def export_snapshot(self, directory: str) -> dict[str, int]:
+        """Write every snapshot table to directory/<table>.parquet (zstd) from one consistent read"""
+        cursor = self.manager.reader()
+        counts = {}
+        cursor.begin()
+        try:
+            for table in SNAPSHOT_TABLES:
+                path = os.path.join(directory, f"{table}.parquet").replace("'", "''")
+                result = cursor.execute(
+                    f"COPY {table} TO '{path}' (FORMAT PARQUET, COMPRESSION ZSTD)"
+                ).fetchone()
+                counts[table] = result[0] if result else 0
+            cursor.commit()
+        except Exception:
+            cursor.rollback()
+            raise
+        return counts
+
+    @metrics.timed("db.import_snapshot")
+    def import_snapshot(self, directory: str, replace: bool = False) -> dict[str, int]:
+        """Bulk load a snapshot written by export_snapshot.
+
+        With replace=True the current rows of the snapshot tables are deleted
+        first; otherwise the rows are added to the existing ones.
+        """
+        counts = {}
+        with self.manager.writer() as cursor:
+            if replace:
+                cursor.begin()
+                try:
+                    for table in reversed(SNAPSHOT_TABLES[1:]):
+                        cursor.execute(f"DELETE FROM {table}")
+                    cursor.commit()
+                except Exception:
+                    cursor.rollback()
+                    raise
+                # Referenced rows go in a second transaction, see delete_embeddings_before
+                cursor.execute("DELETE FROM hn_embeddings")
+
+            cursor.begin()
+            try:
+                for table in SNAPSHOT_TABLES:
+                    path = os.path.join(directory, f"{table}.parquet").replace("'", "''")
+                    # By name, so columns added later by ALTER TABLE still line up
+                    result = cursor.execute(
+                        f"INSERT INTO {table} BY NAME SELECT * FROM read_parquet('{path}')"
+                    ).fetchone()
+                    counts[table] = result[0] if result else 0
+                cursor.commit()
+            except Exception:
+                cursor.rollback()
+                raise
+
+            for table, sequence in _SNAPSHOT_SEQUENCES.items():
+                # Move the sequence past the imported ids so new rows do not collide
+                max_id = cursor.execute(f"SELECT coalesce(max(id), 0) FROM {table}").fetchone()[0]
+                next_id = cursor.execute(f"SELECT nextval('{sequence}')").fetchone()[0]
+                if next_id < max_id:
+                    cursor.execute(f"SELECT max(nextval('{sequence}')) FROM range(?)", [max_id - next_id])
+        return counts
+
+    def get_known_post_ids(self, post_ids: list[int]) -> set[int]:
+        """Return the subset of post_ids that is already stored, in one query"""
+        if not post_ids:
+            return set()
+        # Scanned by DuckDB as a table, see bulk_insert_into_embeddings_table
+        candidate_ids = np.asarray(post_ids, dtype=np.int64)
+        query = """
+        SELECT hn_post_id FROM hn_embeddings
+        WHERE hn_post_id IN (SELECT column0 FROM candidate_ids)
+        """
+        cursor = self.manager.reader()
         results = cursor.execute(query).fetchall()
-        return [self._tuple_to_dict(result) for result in results]
+        return {row[0] for row in results}
 
-    def get_clustered_data(self) -> list[dict]:
+    @metrics.timed("db.update_post_counts")
+    def update_post_counts(self, posts: list[dict]) -> int:
+        """Set score and descendants from fetched HN items, in one statement; returns the rows updated"""
+        if not posts:
+            return 0
+        # Scanned by DuckDB as tables, see bulk_insert_into_embeddings_table
+        hn_post_ids = np.array([post["id"] for post in posts], dtype=np.int64)
+        scores = np.array([_count(post.get("score")) for post in posts], dtype=np.int64)
+        descendants = np.array([_count(post.get("descendants")) for post in posts], dtype=np.int64)
         query = """
-        SELECT * FROM hn_embeddings
+        UPDATE hn_embeddings
+        SET score = coalesce(counts.score, hn_embeddings.score),
+            descendants = coalesce(counts.descendants, hn_embeddings.descendants)
+        FROM (
+            SELECT p.column0 AS hn_post_id, nullif(s.column0, -1) AS score, nullif(d.column0, -1) AS descendants
+            FROM hn_post_ids p
+            POSITIONAL JOIN scores s
+            POSITIONAL JOIN descendants d
+        ) counts
+        WHERE hn_embeddings.hn_post_id = counts.hn_post_id
+        """
+        with self.manager.writer() as cursor:
+            result = cursor.execute(query).fetchone()
+            return result[0] if result else 0
+
+    def get_crawl_state(self, key: str) -> int | None:
+        query = """
+        SELECT value FROM hn_crawl_state WHERE key = ?
+        """
+        cursor = self.manager.reader()
+        result = cursor.execute(query, [key]).fetchone()
+        return result[0] if result else None
+
+    def set_crawl_state(self, key: str, value: int) -> None:
+        query = """
+        INSERT OR REPLACE INTO hn_crawl_state(key, value) VALUES (?, ?)
+        """
+        with self.manager.writer() as cursor:
+            cursor.execute(query, [key, value])
+
+    @metrics.timed("db.insert_crawl_run")
+    def insert_crawl_run(self, stats: CrawlStatsModel) -> None:
+        query = """
+        INSERT INTO hn_crawl_runs(
+            started_at, finished_at, n_candidates, n_skipped, n_fetched, n_inserted, n_failed, n_refreshed
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        with self.manager.writer() as cursor:
+            cursor.execute(query, [
+                stats.started_at,
+                stats.finished_at,
+                stats.n_candidates,
+                stats.n_skipped,
+                stats.n_fetched,
+                stats.n_inserted,
+                stats.n_failed,
+                stats.n_refreshed
+            ])
+
+    def get_cluster_members(self, cluster_idxs: list[int] | None = None) -> dict[int, dict]:
+        """Return {cluster_idx: {"titles": [...], "hn_post_ids": [...]}} ordered by embedding id"""
+        query = """
+        SELECT
+            hn_clusters.cluster_idx,
+            list(hn_embeddings.title ORDER BY hn_embeddings.id),
+            list(hn_embeddings.hn_post_id ORDER BY hn_embeddings.id)
+        FROM hn_embeddings
         INNER JOIN hn_clusters ON hn_embeddings.id = hn_clusters.hn_embedding_id
+        WHERE ?::INTEGER[] IS NULL OR list_contains(?::INTEGER[], hn_clusters.cluster_idx)
+        GROUP BY hn_clusters.cluster_idx
+        ORDER BY hn_clusters.cluster_idx
         """
-        cursor = self.conn.cursor()
-        results = cursor.execute(query).fetchall()
-        return [self._tuple_to_dict(result) for result in results]
+        if cluster_idxs is not None:
+            cluster_idxs = [int(idx) for idx in cluster_idxs]
+        cursor = self.manager.reader()
+        results = cursor.execute(query, [cluster_idxs, cluster_idxs]).fetchall()
+        return {row[0]: {"titles": row[1], "hn_post_ids": row[2]} for row in results}
+
+    def get_cluster_display_columns(self, limit: int = 5) -> dict[str, np.ndarray]:
+        """Return every cluster's title and top `limit` posts in one columnar result.
+
+        Rows are ordered by cluster_idx and then by post rank within the cluster.
+        """
+        query = """
+        SELECT
+            hn_clusters.cluster_idx,
+            coalesce(hn_cluster_titles.title, 'Cluster ' || hn_clusters.cluster_idx) AS cluster_title,
+            hn_embeddings.title,
+            hn_embeddings.url,
+            hn_embeddings.hn_post_id,
+            ROW_NUMBER() OVER (
+                PARTITION BY hn_clusters.cluster_idx ORDER BY hn_embeddings.id
+            ) AS post_rank
+        FROM hn_clusters
+        INNER JOIN hn_embeddings ON hn_embeddings.id = hn_clusters.hn_embedding_id
+        LEFT JOIN hn_cluster_titles ON hn_cluster_titles.hn_cluster_idx = hn_clusters.cluster_idx
+        QUALIFY post_rank <= ?
+        ORDER BY hn_clusters.cluster_idx, post_rank
+        """
+        cursor = self.manager.reader()
+        return cursor.execute(query, [limit]).fetchnumpy()
+
+    def get_embedding_by_post_id(self, hn_post_id: int, backend: str) -> tuple[int, np.ndarray] | None:
+        query = f"""
+        SELECT id, {_embedding_columns()} FROM hn_embeddings WHERE hn_post_id = ? AND embedding_backend = ?
+        """
+        cursor = self.manager.reader()
+        result = cursor.execute(query, [hn_post_id, backend]).fetchnumpy()
+        if len(result["id"]) == 0:
+            return None
+        return int(result["id"][0]), _decode_embeddings(result)[0][0]
+
+    def get_posts_by_ids(self, embedding_ids: list[int]) -> list[dict]:
+        """Return posts for the given embedding ids in the same order; missing ids are skipped"""
+        if not embedding_ids:
+            return []
+        query = """
+        SELECT id, title, url, hn_post_id FROM hn_embeddings
+        WHERE list_contains(?::BIGINT[], id)
+        """
+        cursor = self.manager.reader()
+        results = cursor.execute(query, [[int(i) for i in embedding_ids]]).fetchall()
+        posts = {row[0]: {"title": row[1], "url": row[2], "hn_post_id": row[3]} for row in results}
+        return [posts[i] for i in embedding_ids if i in posts]
 
     def get_unqiue_cluster_idx(self) -> list[int]:
         query = """
         SELECT DISTINCT cluster_idx FROM hn_clusters
         """
-        cursor = self.conn.cursor()
+        cursor = self.manager.reader()
         results = cursor.execute(query).fetchall()
         return [result[0] for result in results]
 
-    def get_records_by_cluster_idx(self, cluster_idx: int, limit: int = 5) -> list[dict]:
-        query = """
-        SELECT * FROM hn_embeddings
-        INNER JOIN hn_clusters ON hn_embeddings.id = hn_clusters.hn_embedding_id
-        WHERE hn_clusters.cluster_idx = ?
-        LIMIT ?
-        """
-        cursor = self.conn.cursor()
-        results = cursor.execute(query, [cluster_idx, limit]).fetchall()
-        return [self._tuple_to_dict(result) for result in results]
-
     def get_posts_by_cluster_idx(self, cluster_idx: int, limit: int = 5) -> list[dict]:
         query = """
         SELECT title, url, hn_post_id FROM hn_embeddings
@@ -175,10 +1024,6 @@ class ClusterRepository:
         WHERE hn_clusters.cluster_idx = ?
         LIMIT ?
         """
-        cursor = self.conn.cursor()
+        cursor = self.manager.reader()
         results = cursor.execute(query, [cluster_idx, limit]).fetchall()
         return [{"title": row[0], "url": row[1], "hn_post_id": row[2]} for row in results]
-
-    def __del__(self):
-        if hasattr(self, 'conn'):
-            self.conn.close()
@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import queue
+import time
+
+import numpy as np
+
+from ..config import settings
+from ..infrastructure import quantization
+from ..logger import setup_logger
+
+# Worker processes import this module, so it must not open the database
+logger = setup_logger(__name__)
+
+_sample: np.ndarray | None = None
+
+
+def _init_worker(sample: np.ndarray) -> None:
+    global _sample
+    _sample = sample
+
+
+def score_k(k: int, sample: np.ndarray | None = None) -> float:
+    """Silhouette of a KMeans fit with k clusters, scored on a fixed-size subsample"""
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+    from threadpoolctl import threadpool_limits
+
+    sample = _sample if sample is None else sample
+    # Parallelism comes from the pool; one BLAS thread per worker avoids oversubscription
+    with threadpool_limits(limits=1):
+        labels = KMeans(n_clusters=k, random_state=0).fit_predict(sample)
+        return float(silhouette_score(
+            sample, labels, sample_size=min(len(sample), settings["AUTO_K_SCORE_SAMPLE"]), random_state=0
+        ))
+
+
+def select_n_clusters(
+    embeddings: np.ndarray, scales: np.ndarray | None = None
+) -> tuple[int, dict[int, float]]:
+    """Sweep AUTO_K_MIN..AUTO_K_MAX in a process pool and return (best k, scores).
+
+    Fits run on a subsample of at most AUTO_K_FIT_SAMPLE posts, so the cost
+    does not grow with the corpus. Candidates still running when
+    AUTO_K_TIME_BUDGET seconds have passed are dropped and their workers
+    terminated, so the sweep never outlives the budget. Falls back to
+    N_CLUSTERS when nothing finished in time or there is too little data.
+    embeddings may be quantized codes with their scales; only the subsample
+    is dequantized.
+    """
+    # Never more clusters than posts, which KMeans rejects
+    fallback = min(settings["N_CLUSTERS"], len(embeddings))
+    k_max = min(settings["AUTO_K_MAX"], len(embeddings) - 1)
+    candidates = list(range(settings["AUTO_K_MIN"], k_max + 1))
+    if not candidates:
+        return fallback, {}
+
+    rng = np.random.default_rng(0)
+    n_sample = min(len(embeddings), settings["AUTO_K_FIT_SAMPLE"])
+    rows = rng.choice(len(embeddings), n_sample, replace=False)
+    sample = np.ascontiguousarray(
+        quantization.dequantize(embeddings[rows], None if scales is None else scales[rows])
+    )
+
+    deadline = time.monotonic() + settings["AUTO_K_TIME_BUDGET"]
+    scores: dict[int, float] = {}
+    # (k, score, error) as each candidate finishes
+    finished: queue.SimpleQueue = queue.SimpleQueue()
+    # A multiprocessing Pool rather than a ProcessPoolExecutor: only a Pool can
+    # terminate workers mid-task. spawn, not fork: the parent holds DuckDB and executor threads
+    pool = multiprocessing.get_context("spawn").Pool(
+        processes=min(len(candidates), settings["AUTO_K_WORKERS"] or os.cpu_count() or 1),
+        initializer=_init_worker,
+        initargs=(sample,),
+    )
+    try:
+        for k in candidates:
+            pool.apply_async(
+                score_k, (k,),
+                callback=lambda score, k=k: finished.put((k, score, None)),
+                error_callback=lambda error, k=k: finished.put((k, None, error)),
+            )
+        pending = set(candidates)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                k, score, error = finished.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.discard(k)
+            if error is not None:
+                logger.error(f"Scoring k={k} failed: {error}")
+            else:
+                scores[k] = score
+        if pending:
+            logger.warning(f"Auto-k time budget exhausted, skipped k={sorted(pending)}")
+    finally:
+        # Candidates still running would otherwise keep every core busy past the budget
+        pool.terminate()
+        pool.join()
+
+    if not scores:
+        return fallback, scores
+    best_k = max(scores, key=scores.get)
+    logger.info(
+        f"Auto-k chose k={best_k} over {len(embeddings)} posts, silhouette scores: "
+        + ", ".join(f"{k}={score:.3f}" for k, score in sorted(scores.items()))
+    )
+    return best_k, scores
@@ -1,85 +1,269 @@
 import json
+import threading
 import time
+from collections import OrderedDict
 from typing import Any, Optional
 
-from app.infrastructure import duckdb_connection
+from app.config import settings
+from app.infrastructure import duckdb_connection, metrics
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with per-entry TTL.
+
+    Values are stored JSON-encoded, like the DuckDB tier, so callers always get
+    a fresh copy and the encoded length bounds the memory footprint.
+    Entries are evicted least-recently-used first once max_entries or
+    max_bytes is exceeded.
+    """
+
+    def __init__(self, max_entries: int | None = None, max_bytes: int | None = None) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[str, Optional[float]]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            serialized_value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return serialized_value
+
+    def set(self, key: str, serialized_value: str, expires_at: Optional[float] = None) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (serialized_value, expires_at)
+            self._bytes += len(serialized_value)
+            while self._entries and self._over_capacity():
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            return count
+
+    def clear_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [
+                key for key, (_, expires_at) in self._entries.items()
+                if expires_at is not None and expires_at <= now
+            ]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+            return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _remove(self, key: str) -> None:
+        serialized_value, _ = self._entries.pop(key)
+        self._bytes -= len(serialized_value)
+
+    def _over_capacity(self) -> bool:
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self._bytes > self.max_bytes
+
+
+_memory_tier = LRUCache(
+    max_entries=settings["CACHE_MAX_ENTRIES"], max_bytes=settings["CACHE_MAX_BYTES"]
+)
+metrics.register_collector(
+    "cache",
+    lambda: [({}, _memory_tier.stats())],
+    counters=("hits", "misses", "evictions", "expirations"),
+)
+_table_ready = False
+_table_lock = threading.Lock()
+_sweeper: Optional[threading.Thread] = None
+_sweeper_stop = threading.Event()
+
+
+def _use_duckdb_tier() -> bool:
+    return settings["CACHE_DUCKDB_TIER"]
+
+
+def _manager() -> duckdb_connection.DuckDBConnectionManager:
+    return duckdb_connection.get_manager(settings["CACHE_DB_PATH"])
 
 
 def _init_cache_table():
-    """Initialize the cache table if it doesn't exist"""
-    conn = duckdb_connection.get_conn()
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS cache (
-            key VARCHAR PRIMARY KEY,
-            value TEXT NOT NULL,
-            expires_at TIMESTAMP DEFAULT NULL
-        )
-    """)
+    """Initialize the cache table once per process"""
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        with _manager().writer() as conn:
+            # Tables from before expires_at held epoch seconds are only a cache, so they are dropped
+            legacy = conn.execute("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'cache' AND column_name = 'expires_at' AND data_type = 'TIMESTAMP'
+            """).fetchone()
+            if legacy:
+                conn.execute("DROP TABLE cache")
+            # expires_at is epoch seconds on the same clock as the in-process tier
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key VARCHAR PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at DOUBLE DEFAULT NULL
+                )
+            """)
+        _table_ready = True
 
 
 def set(key: str, value: Any, ttl: int = None) -> None:
     """Cache value to key with optional TTL in seconds"""
-    conn = duckdb_connection.get_conn()
-    _init_cache_table()
-    
     serialized_value = json.dumps(value)
-    
+    expires_at = time.time() + ttl if ttl else None
+    _memory_tier.set(key, serialized_value, expires_at)
     if ttl:
-        expires_at = time.time() + ttl
+        start_sweeper()
+
+    if not _use_duckdb_tier():
+        return
+    _init_cache_table()
+    with _manager().writer() as conn:
         conn.execute("""
             INSERT OR REPLACE INTO cache (key, value, expires_at)
-            VALUES (?, ?, to_timestamp(?))
+            VALUES (?, ?, ?)
         """, [key, serialized_value, expires_at])
-    else:
-        conn.execute("""
-            INSERT OR REPLACE INTO cache (key, value, expires_at)
-            VALUES (?, ?, NULL)
-        """, [key, serialized_value])
 
 
 def get(key: str) -> Any:
     """Get cached value by key, returns None if not found or expired"""
-    conn = duckdb_connection.get_conn()
-    _init_cache_table()
-    
-    result = conn.execute("""
-        SELECT value, expires_at
-        FROM cache
-        WHERE key = ?
-        AND (expires_at IS NULL OR expires_at > current_timestamp)
-    """, [key]).fetchone()
-    
-    if not result:
+    serialized_value = _memory_tier.get(key)
+
+    if serialized_value is None and _use_duckdb_tier():
+        _init_cache_table()
+        conn = _manager().reader()
+        result = conn.execute("""
+            SELECT value, expires_at
+            FROM cache
+            WHERE key = ?
+            AND (expires_at IS NULL OR expires_at > ?)
+        """, [key, time.time()]).fetchone()
+        if result:
+            serialized_value = result[0]
+            # Promote to the in-process tier with the remaining TTL
+            _memory_tier.set(key, serialized_value, result[1])
+
+    if serialized_value is None:
         return None
-    
+
     try:
-        return json.loads(result[0])
-    except (json.JSONDecodeError, IndexError):
+        return json.loads(serialized_value)
+    except json.JSONDecodeError:
         return None
 
 
 def delete(key: str) -> bool:
     """Delete cached value by key, returns True if deleted"""
-    conn = duckdb_connection.get_conn()
+    deleted = _memory_tier.delete(key)
+    if not _use_duckdb_tier():
+        return deleted
+
     _init_cache_table()
-    
-    result = conn.execute("DELETE FROM cache WHERE key = ?", [key])
-    return result.rowcount > 0
+    with _manager().writer() as conn:
+        result = conn.execute("DELETE FROM cache WHERE key = ?", [key]).fetchone()
+    return deleted or result[0] > 0
 
 
 def clear() -> int:
     """Clear all cached values, returns number of cleared entries"""
-    conn = duckdb_connection.get_conn()
+    cleared = _memory_tier.clear()
+    if not _use_duckdb_tier():
+        return cleared
+
     _init_cache_table()
-    
-    result = conn.execute("DELETE FROM cache")
-    return result.rowcount
+    with _manager().writer() as conn:
+        result = conn.execute("DELETE FROM cache").fetchone()
+    return max(cleared, result[0])
 
 
 def clear_expired() -> int:
     """Clear expired cached values, returns number of cleared entries"""
-    conn = duckdb_connection.get_conn()
+    cleared = _memory_tier.clear_expired()
+    if not _use_duckdb_tier():
+        return cleared
+
     _init_cache_table()
-    
-    result = conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= current_timestamp")
-    return result.rowcount
\ No newline at end of file
+    with _manager().writer() as conn:
+        result = conn.execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", [time.time()]
+        ).fetchone()
+    return cleared + result[0]
+
+
+def stats() -> dict:
+    """Hit/miss/eviction counters and size of the in-process tier"""
+    return {**_memory_tier.stats(), "duckdb_tier": _use_duckdb_tier()}
+
+
+def _sweep_loop(interval: float) -> None:
+    while not _sweeper_stop.wait(interval):
+        try:
+            clear_expired()
+        except Exception:
+            # The sweeper must never die; the next tick retries
+            continue
+
+
+def start_sweeper(interval: float | None = None) -> None:
+    """Start the background thread that drops expired entries (idempotent)"""
+    global _sweeper
+    if _sweeper is not None and _sweeper.is_alive():
+        return
+    with _table_lock:
+        if _sweeper is not None and _sweeper.is_alive():
+            return
+        _sweeper_stop.clear()
+        _sweeper = threading.Thread(
+            target=_sweep_loop,
+            args=(interval or settings["CACHE_SWEEP_INTERVAL"],),
+            name="cache-sweeper",
+            daemon=True,
+        )
+        _sweeper.start()
+
+
+def stop_sweeper() -> None:
+    _sweeper_stop.set()
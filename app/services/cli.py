@@ -0,0 +1,125 @@
+"""Snapshot export/import for cold starts and backups.
+
+Usage:
+    python -m app.services.cli export <directory>
+    python -m app.services.cli import <directory> [--replace]
+
+The CLI opens DB_PATH itself, and DuckDB lets only one process hold it, so
+the bot must be stopped first. While the bot runs, snapshots are exported
+in-process every SNAPSHOT_INTERVAL seconds or with the /snapshot admin command.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import duckdb
+
+from ..config import settings
+from ..logger import setup_logger
+from ..repositories.cluster import ClusterRepository
+from . import payload_cache, vector_index
+
+logger = setup_logger(__name__)
+
+cluster_repo = ClusterRepository()
+
+SNAPSHOT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+
+def _create_tables() -> None:
+    cluster_repo.create_embeddings_table()
+    cluster_repo.create_cluster_table()
+    cluster_repo.create_cluster_title_table()
+    cluster_repo.create_cluster_centroids_table()
+    cluster_repo.create_duplicates_table()
+
+
+def export_snapshot(directory: str) -> dict[str, int]:
+    """Export embeddings, clusters, titles, centroids and dedup results as zstd Parquet.
+
+    The files are written next to the target and renamed into place, so an
+    interrupted export never leaves a half-written snapshot behind.
+    """
+    _create_tables()
+    start = time.perf_counter()
+    tmp_dir = f"{directory.rstrip(os.sep)}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    counts = cluster_repo.export_snapshot(tmp_dir)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump({
+            "version": SNAPSHOT_VERSION,
+            "created_at": datetime.now().isoformat(),
+            "source_db": settings["DB_PATH"],
+            "counts": counts,
+        }, f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    logger.info(f"Exported snapshot {counts} to {directory} in {time.perf_counter() - start:.2f}s")
+    return counts
+
+
+def _non_empty_tables() -> list[str]:
+    return [table for table, count in cluster_repo.count_snapshot_rows().items() if count]
+
+
+def import_snapshot(directory: str, replace: bool = False) -> dict[str, int]:
+    """Bulk load a snapshot; without replace every snapshot table must still be empty"""
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    assert manifest["version"] == SNAPSHOT_VERSION, f"Unsupported snapshot version {manifest['version']}"
+    _create_tables()
+    # Leftover titles or centroids would otherwise fail the insert on their primary keys
+    if not replace and (non_empty := _non_empty_tables()):
+        raise ValueError(f"Tables {non_empty} already hold rows; pass replace=True to overwrite them")
+
+    start = time.perf_counter()
+    counts = cluster_repo.import_snapshot(directory, replace=replace)
+    # Derived state is rebuilt from the imported rows
+    vector_index.rebuild_index()
+    payload_cache.invalidate()
+    logger.info(f"Imported snapshot {counts} from {directory} in {time.perf_counter() - start:.2f}s")
+    return counts
+
+
+def import_snapshot_if_empty(directory: str | None = None) -> bool:
+    """Cold start: import SNAPSHOT_PATH when the database has no posts yet"""
+    directory = directory or settings["SNAPSHOT_PATH"]
+    if not directory or not os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+        return False
+    _create_tables()
+    if non_empty := _non_empty_tables():
+        if "hn_embeddings" not in non_empty:
+            logger.warning(f"Not importing {directory}: tables {non_empty} already hold rows")
+        return False
+    import_snapshot(directory)
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.services.cli", description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="write a snapshot of the database")
+    export_parser.add_argument("directory")
+    import_parser = subparsers.add_parser("import", help="load a snapshot into the database")
+    import_parser.add_argument("directory")
+    import_parser.add_argument("--replace", action="store_true", help="overwrite the existing posts")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            counts = export_snapshot(args.directory)
+        else:
+            counts = import_snapshot(args.directory, replace=args.replace)
+    except duckdb.IOException as e:
+        # Most likely the running bot holds the database lock
+        parser.exit(1, f"Could not open {settings['DB_PATH']}, stop the bot first or use /snapshot: {e}\n")
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    main()
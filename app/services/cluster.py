@@ -1,104 +1,294 @@
-from collections import defaultdict
+import hashlib
+from datetime import datetime, timedelta
 
-from sklearn.cluster import KMeans
-from tqdm import tqdm
+import numpy as np
 
 from ..config import settings
+from ..infrastructure import metrics, quantization
 from ..logger import setup_logger
 from ..models.cluster import ClusterDisplayModel
 from ..repositories.cluster import ClusterRepository
-from .llm import call_llm
+from . import auto_k, cluster_worker, dedup, payload_cache
+from .embedding import backend_name
+from .llm import call_llm_batch
 
 logger = setup_logger(__name__)
 
 cluster_repo = ClusterRepository()
 
-def execute_cluster():
-    """Execute clustering and generate titles"""
-    clusters = cluster_repo.get_clusters()
-    cluster_titles = cluster_repo.get_cluster_titles()
-    
-    # Check if both clusters and titles exist
-    if len(clusters) > 0 and len(cluster_titles) > 0:
-        return
+TITLE_SYSTEM_PROMPT = (
+    "You are given a list of titles that belong to the same semantic cluster. "
+    "Your task is to assign a single, concise title that captures the shared semantic meaning of the titles. "
+    "Strictly return the result as a valid JSON object. "
+    "Do not include explanations, extra text, or code blocks. "
+    "Return only this format:\n\n"
+    "{ \"title\": \"YOUR_ANSWER_HERE\" }"
+)
+
+# Posts assigned incrementally since the centroids were last refined
+_assigned_since_refine = 0
+
+def _nearest_centroids(
+    embeddings: np.ndarray, centroids: np.ndarray, chunk_size: int = 4096, scales: np.ndarray | None = None
+) -> np.ndarray:
+    """Return the row index of the nearest centroid for every embedding (float32 or quantized codes)"""
+    centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+    positions = np.empty(len(embeddings), dtype=np.int64)
+    for start, block in quantization.iter_dequantized(embeddings, scales, chunk_size):
+        # ||x||^2 is the same for every centroid, so it does not affect the argmin
+        distances = centroid_norms - 2 * block @ centroids.T
+        positions[start:start + chunk_size] = distances.argmin(axis=1)
+    return positions
+
+def window_start() -> datetime | None:
+    """Oldest created_at that is still clustered, or None to cluster everything"""
+    hours = settings["CLUSTER_WINDOW_HOURS"]
+    return datetime.now() - timedelta(hours=hours) if hours else None
+
+def fit_clusters(auto: bool | None = None) -> list[int]:
+    """Refit KMeans over the canonical posts in the window and replace all assignments and centroids.
 
+    With auto (default: N_CLUSTERS_AUTO) the number of clusters is picked by
+    auto_k.select_n_clusters instead of N_CLUSTERS.
+    """
+    global _assigned_since_refine
     assert "N_CLUSTERS" in settings.keys(), "Missing N_CLUSTERS."
-    records = cluster_repo.get_records()
-    embeddings = [record["embedding"] for record in records]
-    cluster_result = KMeans(
-        n_clusters=settings["N_CLUSTERS"], random_state=0
-    ).fit(embeddings)
-
-    cluster_labels = cluster_result.labels_
-    cluster_to_ids = defaultdict(list)
-    for i, record in enumerate(records):
-        record["cluster_idx"] = int(cluster_labels[i])
-        cluster_to_ids[cluster_labels[i]].append(record["title"])
-
-    # Use transaction to ensure data consistency
-    try:
-        cluster_repo.insert_to_cluster_table(records)
-        
-        # Clear existing titles if any
-        cluster_repo.clear_cluster_titles()
-
-        # Generate titles for each cluster
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are given a list of titles that belong to the same semantic cluster. "
-                    "Your task is to assign a single, concise title that captures the shared semantic meaning of the titles. "
-                    "Strictly return the result as a valid JSON object. "
-                    "Do not include explanations, extra text, or code blocks. "
-                    "Return only this format:\n\n"
-                    "{ \"title\": \"YOUR_ANSWER_HERE\" }"
-                ),
-            }
-        ] 
-        titles_to_insert = []
-        logger.info(f"Generating titles for {len(cluster_to_ids)} clusters")
-        for i, titles in tqdm(cluster_to_ids.items(), desc="Processing clusters", total=len(cluster_to_ids)):
-            messages_copy = messages.copy()
-            messages_copy.append({"role": "user", "content": f"List of titles: {','.join(titles)}"})
-            result = call_llm(messages=messages_copy, model=settings["LLM_MODEL"])
-            assert isinstance(result, dict), f"LLM repsonse must be a dictionary, Got: {type(result)=}"
-            assert "title" in result, "LLM response must contains title field"
-            titles_to_insert.append([int(i), result["title"]])
-            logger.info(f"Generated title for cluster {i}: {result['title']}")
-
-        # Batch insert all titles
-        cluster_repo.insert_to_cluster_title_table(titles_to_insert)
-        
-    except Exception as e:
-        # Rollback on failure - clear any partial data
-        cluster_repo.clear_cluster_table()
-        cluster_repo.clear_cluster_titles()
-        raise e
-
-def get_cluster_display_data() -> list[ClusterDisplayModel]:
-    """Get complete cluster data with titles and posts"""
-    clusters = cluster_repo.get_clusters()
-    if len(clusters) == 0:
-        execute_cluster()
-    
-    cluster_data = []
-    cluster_idxs = cluster_repo.get_unqiue_cluster_idx()
-    
-    for cluster_idx in cluster_idxs:
-        # Get cluster title
-        title_query = "SELECT title FROM hn_cluster_titles WHERE hn_cluster_idx = ?"
-        cursor = cluster_repo.conn.cursor()
-        title_result = cursor.execute(title_query, [cluster_idx]).fetchone()
-        title = title_result[0] if title_result else f"Cluster {cluster_idx}"
-        
-        # Get posts for this cluster
-        posts = cluster_repo.get_posts_by_cluster_idx(cluster_idx, limit=5)
-        
-        cluster_data.append(ClusterDisplayModel(
-            cluster_idx=cluster_idx,
-            title=title,
-            posts=posts
-        ))
-    
-    return cluster_data
+    if auto is None:
+        auto = settings["N_CLUSTERS_AUTO"]
+    backend = backend_name()
+    # Kept as EMBEDDING_STORAGE codes; only the worker expands them to float32
+    embedding_ids, codes, scales = cluster_repo.get_compact_embedding_matrix(
+        canonical_only=True, since=window_start(), backend=backend, storage=settings["EMBEDDING_STORAGE"]
+    )
+    if len(embedding_ids) == 0:
+        logger.info("No posts in the clustering window, skipping the fit")
+        return []
+    n_clusters = auto_k.select_n_clusters(codes, scales)[0] if auto else settings["N_CLUSTERS"]
+    # KMeans needs at least one post per cluster
+    n_clusters = min(n_clusters, len(embedding_ids))
+    with metrics.span("cluster.kmeans_fit"):
+        cluster_labels, centroids = cluster_worker.fit_kmeans(codes, n_clusters, scales)
+
+    cluster_idxs = np.arange(n_clusters)
+    n_members = np.bincount(cluster_labels, minlength=n_clusters)
+
+    cluster_repo.bulk_insert_to_cluster_table(embedding_ids, cluster_labels, replace=True)
+    cluster_repo.save_centroids(cluster_idxs, centroids, n_members, replace=True, backend=backend)
+    # Titles are kept: clusters whose membership survived the refit reuse them
+    cluster_repo.mark_clusters_for_retitle(cluster_idxs.tolist())
+    _assigned_since_refine = 0
+    logger.info(f"Fitted {n_clusters} clusters over {len(embedding_ids)} posts")
+    return cluster_idxs.tolist()
+
+def assign_new_posts() -> list[int]:
+    """Assign unclustered posts to their nearest centroid and update centroids in place.
+
+    Centroids move by the running mean of their members, the same per-center
+    update MiniBatchKMeans applies. Returns the clusters whose membership changed.
+    """
+    global _assigned_since_refine
+    cluster_idxs, centroids, n_members = cluster_repo.get_centroids()
+    embedding_ids, embeddings = cluster_repo.get_unclustered_embedding_matrix(
+        since=window_start(), backend=backend_name()
+    )
+    if len(embedding_ids) == 0 or len(centroids) == 0:
+        return []
+
+    positions = _nearest_centroids(embeddings, centroids)
+    counts = np.bincount(positions, minlength=len(centroids))
+    sums = np.zeros_like(centroids)
+    np.add.at(sums, positions, embeddings)
+
+    changed = counts > 0
+    new_n_members = n_members + counts
+    centroids[changed] = (
+        centroids[changed] * n_members[changed, None] + sums[changed]
+    ) / new_n_members[changed, None]
+
+    cluster_repo.bulk_insert_to_cluster_table(embedding_ids, cluster_idxs[positions])
+    cluster_repo.save_centroids(cluster_idxs, centroids, new_n_members)
+    changed_idxs = cluster_idxs[changed].tolist()
+    cluster_repo.mark_clusters_for_retitle(changed_idxs)
+    _assigned_since_refine += len(embedding_ids)
+    logger.info(f"Assigned {len(embedding_ids)} new posts to clusters {changed_idxs}")
+    return changed_idxs
+
+def expire_old_posts(before: datetime | None = None) -> list[int]:
+    """Unassign posts created before `before` (default: the window start).
+
+    Their contribution is subtracted from the running-mean centroids, so the
+    clusters keep describing only the posts that remain. Returns the
+    clusters that lost members.
+    """
+    before = before or window_start()
+    if before is None:
+        return []
+    cluster_idxs, centroids, n_members = cluster_repo.get_centroids()
+    embedding_ids, labels, embeddings = cluster_repo.get_cluster_assignments_before(before)
+    if len(embedding_ids) == 0 or len(centroids) == 0:
+        return []
+
+    positions = np.searchsorted(cluster_idxs, labels)
+    counts = np.bincount(positions, minlength=len(centroids))
+    sums = np.zeros_like(centroids)
+    np.add.at(sums, positions, embeddings)
+
+    changed = counts > 0
+    remaining = np.maximum(n_members - counts, 0)
+    # Emptied clusters keep their last centroid so new posts can still land there
+    keep = changed & (remaining > 0)
+    centroids[keep] = (
+        centroids[keep] * n_members[keep, None] - sums[keep]
+    ) / remaining[keep, None]
+
+    cluster_repo.delete_cluster_assignments(embedding_ids)
+    cluster_repo.save_centroids(cluster_idxs, centroids, remaining)
+    changed_idxs = cluster_idxs[changed].tolist()
+    cluster_repo.mark_clusters_for_retitle(changed_idxs)
+    logger.info(f"Expired {len(embedding_ids)} posts older than {before} from clusters {changed_idxs}")
+    return changed_idxs
+
+def refine_centroids() -> list[int]:
+    """Refine centroids with MiniBatchKMeans.partial_fit and reassign every post.
+
+    Returns the clusters that gained or lost members.
+    """
+    global _assigned_since_refine
+    cluster_idxs, centroids, _ = cluster_repo.get_centroids()
+    embedding_ids, codes, scales = cluster_repo.get_compact_embedding_matrix(
+        canonical_only=True, since=window_start(), backend=backend_name(), storage=settings["EMBEDDING_STORAGE"]
+    )
+    if len(embedding_ids) < len(centroids):
+        return []
+
+    chunk_size = max(settings["EMBEDDING_CHUNK_SIZE"], len(centroids))
+    with metrics.span("cluster.kmeans_refine"):
+        refined = cluster_worker.refine_kmeans(codes, centroids, chunk_size, scales)
+
+    positions = _nearest_centroids(codes, refined, scales=scales)
+    new_labels = cluster_idxs[positions]
+    old_ids, old_labels = cluster_repo.get_cluster_assignments()
+    # Both sides are ordered by embedding id; unassigned posts count as moved
+    aligned = np.full(len(embedding_ids), -1, dtype=np.int64)
+    found = np.isin(embedding_ids, old_ids)
+    aligned[found] = old_labels[np.searchsorted(old_ids, embedding_ids[found])]
+    moved = aligned != new_labels
+    changed_idxs = sorted(
+        set(new_labels[moved].tolist()) | set(aligned[moved & found].tolist())
+    )
+
+    n_members = np.bincount(positions, minlength=len(centroids))
+    cluster_repo.bulk_insert_to_cluster_table(embedding_ids, new_labels, replace=True)
+    cluster_repo.save_centroids(cluster_idxs, refined, n_members)
+    cluster_repo.mark_clusters_for_retitle(changed_idxs)
+    _assigned_since_refine = 0
+    logger.info(f"Refined centroids, {int(moved.sum())} posts moved between clusters {changed_idxs}")
+    return changed_idxs
+
+def membership_hash(hn_post_ids: list[int]) -> str:
+    """Stable key for a cluster's membership, independent of member order"""
+    members = ",".join(str(post_id) for post_id in sorted(hn_post_ids))
+    return hashlib.sha256(members.encode("utf-8")).hexdigest()
+
+def generate_cluster_titles(cluster_idxs: list[int]) -> None:
+    """Title the given clusters and clear their retitle flag.
+
+    Clusters whose member set already has a stored title reuse it; the others
+    are sent to the LLM concurrently, at most LLM_CONCURRENCY at a time.
+    """
+    if not cluster_idxs:
+        return
+    cluster_members = cluster_repo.get_cluster_members(cluster_idxs)
+    hashes = {i: membership_hash(members["hn_post_ids"]) for i, members in cluster_members.items()}
+    cached_titles = cluster_repo.get_titles_by_membership_hash(list(hashes.values()))
+
+    titles_to_insert = [
+        [int(i), cached_titles[hashes[i]], hashes[i]] for i in cluster_members if hashes[i] in cached_titles
+    ]
+    to_generate = [i for i in cluster_members if hashes[i] not in cached_titles]
+    logger.info(
+        f"Generating titles for {len(to_generate)} clusters, reusing {len(titles_to_insert)} cached titles"
+    )
+
+    messages_list = [
+        [
+            {"role": "system", "content": TITLE_SYSTEM_PROMPT},
+            {"role": "user", "content": f"List of titles: {','.join(cluster_members[i]['titles'])}"},
+        ]
+        for i in to_generate
+    ]
+    results = call_llm_batch(messages_list, model=settings["LLM_MODEL"])
+    for i, result in zip(to_generate, results):
+        # Failed clusters keep their retitle flag and are retried next run
+        if isinstance(result, Exception):
+            logger.error(f"Generating title for cluster {i} failed: {result}")
+            continue
+        if not isinstance(result, dict) or "title" not in result:
+            logger.error(f"LLM response for cluster {i} must be a dictionary with a title field, Got: {result!r}")
+            continue
+        titles_to_insert.append([int(i), result["title"], hashes[i]])
+        logger.info(f"Generated title for cluster {i}: {result['title']}")
+
+    cluster_repo.insert_to_cluster_title_table(titles_to_insert)
+    titled_idxs = {item[0] for item in titles_to_insert}
+    # Clusters left without members have nothing to title
+    done_idxs = [i for i in cluster_idxs if i in titled_idxs or i not in cluster_members]
+    cluster_repo.mark_clusters_for_retitle(done_idxs, needs_retitle=False)
+
+def execute_cluster(full_refit: bool = False, auto: bool | None = None):
+    """Cluster new posts and retitle the clusters whose membership changed.
+
+    Without stored centroids of the configured embedding backend (or with
+    full_refit) KMeans is fitted from scratch. Otherwise new posts are assigned incrementally, and centroids
+    are refined once CLUSTER_REFINE_EVERY posts have been assigned.
+    Only posts created within CLUSTER_WINDOW_HOURS are clustered; older
+    ones are expired from their clusters. Near-duplicates are collapsed
+    first and never clustered. `auto` selects the number of clusters when
+    fitting from scratch, see fit_clusters.
+    """
+    dedup.dedup_new_posts()
+    _, centroids, _ = cluster_repo.get_centroids()
+    # Vectors of different embedding backends live in different spaces
+    if full_refit or len(centroids) == 0 or cluster_repo.get_centroid_backends() != {backend_name()}:
+        changed_idxs = fit_clusters(auto=auto)
+    else:
+        changed_idxs = expire_old_posts() + assign_new_posts()
+        if _assigned_since_refine >= settings["CLUSTER_REFINE_EVERY"]:
+            changed_idxs += refine_centroids()
+
+    retitle_idxs = cluster_repo.get_clusters_to_retitle()
+    generate_cluster_titles(retitle_idxs)
+
+    # Rendered Telegram payloads are only rebuilt when clusters actually changed
+    if changed_idxs or retitle_idxs:
+        payload_cache.invalidate()
+
+def get_cluster_display_data(limit: int = 5) -> list[ClusterDisplayModel]:
+    """Get complete cluster data with titles and posts.
+
+    Read-only: clustering runs in the background, never on the request path.
+    """
+    columns = cluster_repo.get_cluster_display_columns(limit=limit)
+    cluster_idxs = columns["cluster_idx"]
+    if len(cluster_idxs) == 0:
+        return []
+
+    # Rows are sorted by cluster, so each cluster is one contiguous slice
+    boundaries = np.flatnonzero(np.diff(cluster_idxs)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(cluster_idxs)]))
+    titles = columns["title"].tolist()
+    urls = columns["url"].tolist()
+    hn_post_ids = columns["hn_post_id"].tolist()
+
+    return [
+        ClusterDisplayModel(
+            cluster_idx=int(cluster_idxs[start]),
+            title=columns["cluster_title"][start],
+            posts=[
+                {"title": titles[i], "url": urls[i], "hn_post_id": hn_post_ids[i]}
+                for i in range(start, end)
+            ]
+        )
+        for start, end in zip(starts, ends)
+    ]
@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+import numpy as np
+
+from ..config import settings
+from ..infrastructure import quantization
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _fit_job(
+    codes: np.ndarray, scales: np.ndarray | None, labels: np.ndarray, n_clusters: int
+) -> np.ndarray:
+    from sklearn.cluster import KMeans
+
+    # KMeans needs floats; the full-precision copy only ever exists in the worker
+    kmeans = KMeans(n_clusters=n_clusters, random_state=0).fit(quantization.dequantize(codes, scales))
+    labels[:] = kmeans.labels_
+    return kmeans.cluster_centers_.astype(np.float32)
+
+
+def _refine_job(
+    codes: np.ndarray,
+    scales: np.ndarray | None,
+    labels: np.ndarray,
+    centroids: np.ndarray,
+    chunk_size: int,
+) -> np.ndarray:
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(
+        n_clusters=len(centroids), init=centroids, n_init=1, random_state=0
+    )
+    fitted = False
+    for _, chunk in quantization.iter_dequantized(codes, scales, chunk_size):
+        # partial_fit needs at least one sample per cluster
+        if len(chunk) >= len(centroids):
+            kmeans.partial_fit(chunk)
+            fitted = True
+    # Too few embeddings for a single pass leave the centroids as they were
+    return kmeans.cluster_centers_.astype(np.float32) if fitted else centroids
+
+
+def _call_mapped(
+    job: Callable, codes_path: str, scales_path: str | None, labels_path: str, *args
+) -> np.ndarray:
+    """Worker side: map the handed-over files and run job on them"""
+    codes = np.load(codes_path, mmap_mode="r")
+    scales = np.load(scales_path) if scales_path else None
+    labels = np.load(labels_path, mmap_mode="r+")
+    centroids = job(codes, scales, labels, *args)
+    labels.flush()
+    return centroids
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: a forked copy of the bot would inherit its DuckDB handle and threads
+            _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def _scratch_dir() -> str:
+    # tmpfs keeps the handoff in memory; elsewhere the page cache does
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else settings["ARTIFACT_DIR"]
+    return tempfile.mkdtemp(prefix="tinysignal-cluster-", dir=base)
+
+
+def _run(
+    job: Callable, codes: np.ndarray, scales: np.ndarray | None, *args
+) -> tuple[np.ndarray, np.ndarray]:
+    """Run job(codes, scales, labels, *args) -> centroids; returns (labels, centroids).
+
+    codes and scales are embeddings as encoded by quantization.quantize, so
+    compact storage modes also shrink the handoff. With CLUSTER_IN_WORKER the
+    job runs in a separate process, so KMeans never holds the bot process's
+    GIL. Codes and labels are handed over as .npy files both sides memory-map
+    instead of being pickled; only the centroids travel back through the
+    pool. The worker never opens DuckDB, since only one process can open the
+    database read-write, so the caller writes the results.
+    """
+    codes = np.ascontiguousarray(codes)
+    labels = np.zeros(len(codes), dtype=np.int32)
+    if not settings["CLUSTER_IN_WORKER"]:
+        return labels, job(codes, scales, labels, *args)
+
+    scratch_dir = _scratch_dir()
+    try:
+        codes_path = os.path.join(scratch_dir, "codes.npy")
+        scales_path = os.path.join(scratch_dir, "scales.npy") if scales is not None else None
+        labels_path = os.path.join(scratch_dir, "labels.npy")
+        np.save(codes_path, codes)
+        if scales_path:
+            np.save(scales_path, scales)
+        np.save(labels_path, labels)
+        future = _get_pool().submit(_call_mapped, job, codes_path, scales_path, labels_path, *args)
+        try:
+            centroids = future.result()
+        except BrokenProcessPool:
+            # A crashed worker (e.g. killed for memory) is replaced on the next run
+            logger.error("Clustering worker died, restarting it on the next run")
+            shutdown()
+            raise
+        return np.load(labels_path), centroids
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def fit_kmeans(
+    codes: np.ndarray, n_clusters: int, scales: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Fit KMeans with n_clusters on float32 or quantized embeddings; returns (labels, centroids).
+
+    n_clusters is capped at the number of embeddings, which must not be zero.
+    """
+    assert len(codes) > 0, "Cannot fit KMeans on zero embeddings."
+    return _run(_fit_job, codes, scales, min(n_clusters, len(codes)))
+
+
+def refine_kmeans(
+    codes: np.ndarray, centroids: np.ndarray, chunk_size: int, scales: np.ndarray | None = None
+) -> np.ndarray:
+    """MiniBatchKMeans.partial_fit passes starting from centroids; returns the refined centroids"""
+    return _run(_refine_job, codes, scales, np.asarray(centroids, dtype=np.float32), chunk_size)[1]
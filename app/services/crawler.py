@@ -1,50 +1,328 @@
-import json
-import random
+import asyncio
 import time
 from datetime import datetime
+from typing import Iterator
 
-import requests
-from tqdm import tqdm
+import httpx
 
 from ..config import settings
+from ..infrastructure import metrics
+from ..infrastructure.http_client import (TokenBucket, create_async_client,
+                                          get_json_with_retry)
+from ..logger import setup_logger
+from ..models.crawl import CrawlStatsModel, StageStatsModel
 from ..repositories.cluster import ClusterRepository
-from .hf import get_hf_embeddings
+from . import dedup, embedding, vector_index
+
+logger = setup_logger(__name__)
 
 cluster_repo = ClusterRepository()
 
 
+async def _get_json(path: str):
+    """GET one HN API resource with the crawl's timeout and retries"""
+    async with create_async_client(max_connections=1, timeout=settings["CRAWL_TIMEOUT"]) as client:
+        return await get_json_with_retry(
+            client, f"{settings['HN_URL']}/{path}", max_retries=settings["CRAWL_MAX_RETRIES"]
+        )
+
 def fetch_top_stories() -> dict:
     assert "HN_URL" in settings.keys(), "Missing HN_URL."
-    resp = requests.get(f"{settings['HN_URL']}/topstories.json")
-    return json.loads(resp.text)
+    return asyncio.run(_get_json("topstories.json"))
+
+def fetch_max_item() -> int:
+    """Largest item id HN has handed out so far"""
+    assert "HN_URL" in settings.keys(), "Missing HN_URL."
+    return int(asyncio.run(_get_json("maxitem.json")))
 
-def fetch_by_post_id(post_id: int) -> dict:
+def fetch_updated_item_ids() -> list[int]:
+    """Ids of recently changed items (stories, comments, polls) from updates.json"""
     assert "HN_URL" in settings.keys(), "Missing HN_URL."
-    try: 
-        resp = requests.get(f"{settings['HN_URL']}/item/{post_id}.json")
-        return json.loads(resp.text)
+    return asyncio.run(_get_json("updates.json")).get("items", [])
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+async def _fetch_item(
+    client: httpx.AsyncClient, limiter: TokenBucket, post_id: int
+) -> dict | None:
+    try:
+        with metrics.span("hn.fetch_item"):
+            return await get_json_with_retry(
+                client,
+                f"{settings['HN_URL']}/item/{post_id}.json",
+                limiter=limiter,
+                max_retries=settings["CRAWL_MAX_RETRIES"],
+            )
     except Exception as e:
-        print("Fetching HN post failed: ", e)
-        raise e
+        logger.warning(f"Fetching HN post {post_id} failed: {e}")
+        return None
 
-def fetch_and_insert():
-    post_ids = fetch_top_stories()[:100]
-    for post_id in tqdm(post_ids, desc="Fetching and processing"):
-        fetch_result = fetch_by_post_id(post_id)
-        if not fetch_result: continue
+async def fetch_posts_async(post_ids: list[int]) -> list[dict]:
+    """Fetch HN items concurrently over one keep-alive session.
 
-        try:
-            insert_data = {
-                "title": fetch_result["title"],
-                "url": fetch_result["url"],
-                "hn_post_id": fetch_result["id"],
-                "embedding": get_hf_embeddings(fetch_result["title"]),
-                "created_at": datetime.now()
-            }
-            cluster_repo.insert_into_embeddings_table(insert_data)
+    Concurrency is capped by CRAWL_CONCURRENCY and request rate by a token
+    bucket of CRAWL_RATE_LIMIT requests per second. Items that still fail
+    after CRAWL_MAX_RETRIES are logged and skipped.
+    """
+    assert "HN_URL" in settings.keys(), "Missing HN_URL."
+    concurrency = settings["CRAWL_CONCURRENCY"]
+    limiter = TokenBucket(settings["CRAWL_RATE_LIMIT"])
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with create_async_client(max_connections=concurrency, timeout=settings["CRAWL_TIMEOUT"]) as client:
+        async def _fetch(post_id: int) -> dict | None:
+            async with semaphore:
+                return await _fetch_item(client, limiter, post_id)
+
+        results = await asyncio.gather(*(_fetch(post_id) for post_id in post_ids))
+
+    return [result for result in results if result]
 
+def _record_take(stage: StageStatsModel, queue_depth: int) -> None:
+    stage.n_in += 1
+    stage.max_queue_depth = max(stage.max_queue_depth, queue_depth)
+    stage.mean_queue_depth += (queue_depth - stage.mean_queue_depth) / stage.n_in
+
+async def _get_batch(
+    queue: asyncio.Queue, stage: StageStatsModel, max_items: int, flush_interval: float
+) -> tuple[list, bool]:
+    """Wait for one item, then keep taking items until max_items or flush_interval has passed.
+
+    Returns (items, done), where done means the end-of-input marker was taken.
+    """
+    loop = asyncio.get_running_loop()
+    items = []
+    deadline = None
+    while len(items) < max_items:
+        if not queue.empty():
+            item = queue.get_nowait()
+        else:
+            timeout = None if deadline is None else deadline - loop.time()
+            if timeout is not None and timeout <= 0:
+                break
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                # The getter has not resumed yet, so cancelling it loses no item
+                getter.cancel()
+                break
+            item = getter.result()
+        if item is _DONE:
+            return items, True
+        _record_take(stage, queue.qsize())
+        items.append(item)
+        if deadline is None:
+            deadline = loop.time() + flush_interval
+    return items, False
+
+async def _fetch_stage(
+    post_ids: Iterator[int],
+    client: httpx.AsyncClient,
+    limiter: TokenBucket,
+    posts: asyncio.Queue,
+    stage: StageStatsModel,
+) -> None:
+    # Workers share the id iterator; put() blocks while the embedders are behind
+    for post_id in post_ids:
+        stage.n_in += 1
+        post = await _fetch_item(client, limiter, post_id)
+        if post is None:
+            stage.n_failed += 1
+            continue
+        stage.n_out += 1
+        # Ask HN / job posts have no url and are not clustered
+        if post.get("title") and post.get("url"):
+            await posts.put(post)
+
+async def _embed_stage(
+    backend: embedding.EmbeddingBackend,
+    posts: asyncio.Queue,
+    rows: asyncio.Queue,
+    stage: StageStatsModel,
+) -> None:
+    done = False
+    while not done:
+        batch, done = await _get_batch(
+            posts, stage, settings["EMBEDDING_BATCH_SIZE"], settings["PIPELINE_FLUSH_INTERVAL"]
+        )
+        if not batch:
+            continue
+        try:
+            with metrics.span(f"embedding.{backend.name}"):
+                embeddings = await asyncio.to_thread(backend.embed, [post["title"] for post in batch])
         except Exception as e:
-            print("Inserting failed: ", e)
+            logger.error(f"Embedding a batch of {len(batch)} posts failed: {e}")
+            stage.n_failed += len(batch)
+            continue
+        created_at = datetime.now()
+        for post, post_embedding in zip(batch, embeddings):
+            await rows.put({
+                "title": post["title"],
+                "url": post["url"],
+                "hn_post_id": post["id"],
+                "embedding": post_embedding,
+                "created_at": created_at,
+                "score": post.get("score"),
+                "descendants": post.get("descendants"),
+            })
+        stage.n_out += len(batch)
+
+async def _write_stage(backend: str, rows: asyncio.Queue, stage: StageStatsModel) -> None:
+    # The only task writing to DuckDB; rows are committed in batches
+    done = False
+    while not done:
+        batch, done = await _get_batch(
+            rows, stage, settings["WRITE_BATCH_SIZE"], settings["PIPELINE_FLUSH_INTERVAL"]
+        )
+        if not batch:
             continue
-        
-        time.sleep(random.random()*3)
+        try:
+            stage.n_out += await asyncio.to_thread(
+                cluster_repo.bulk_insert_into_embeddings_table, batch, backend=backend
+            )
+        except Exception as e:
+            logger.error(f"Inserting a batch of {len(batch)} posts failed: {e}")
+            stage.n_failed += len(batch)
+
+async def _report_progress(stages: list[StageStatsModel], queues: list[asyncio.Queue]) -> None:
+    while True:
+        await asyncio.sleep(settings["PIPELINE_REPORT_INTERVAL"])
+        progress = ", ".join(f"{stage.name} {stage.n_out}" for stage in stages)
+        depths = ", ".join(str(queue.qsize()) for queue in queues)
+        logger.info(f"Crawl pipeline: {progress} done, queue depths {depths}")
+
+async def crawl_pipeline(
+    post_ids: list[int], backend: embedding.EmbeddingBackend
+) -> list[StageStatsModel]:
+    """Fetch, embed and store posts in stages joined by bounded queues.
+
+    CRAWL_CONCURRENCY fetchers feed EMBEDDING_CONCURRENCY embedders, which
+    feed one writer that commits every WRITE_BATCH_SIZE rows or
+    PIPELINE_FLUSH_INTERVAL seconds. Each queue holds at most
+    PIPELINE_QUEUE_SIZE items, so a slow stage blocks the ones upstream of
+    it instead of letting work pile up in memory. Returns per-stage stats.
+    """
+    assert "HN_URL" in settings.keys(), "Missing HN_URL."
+    n_fetchers = settings["CRAWL_CONCURRENCY"]
+    n_embedders = settings["EMBEDDING_CONCURRENCY"]
+    posts = asyncio.Queue(maxsize=settings["PIPELINE_QUEUE_SIZE"])
+    rows = asyncio.Queue(maxsize=settings["PIPELINE_QUEUE_SIZE"])
+    fetch, embed, write = stages = [StageStatsModel(name=name) for name in ("fetch", "embed", "write")]
+    limiter = TokenBucket(settings["CRAWL_RATE_LIMIT"])
+    started = time.perf_counter()
+
+    async def _run(stage: StageStatsModel, workers: list, downstream: asyncio.Queue | None, n_consumers: int):
+        await asyncio.gather(*workers)
+        stage.seconds = time.perf_counter() - started
+        for _ in range(n_consumers):
+            await downstream.put(_DONE)
+
+    async with create_async_client(max_connections=n_fetchers) as client:
+        ids = iter(post_ids)
+        reporter = asyncio.create_task(_report_progress(stages, [posts, rows]))
+        try:
+            await asyncio.gather(
+                _run(fetch, [_fetch_stage(ids, client, limiter, posts, fetch) for _ in range(n_fetchers)], posts, n_embedders),
+                _run(embed, [_embed_stage(backend, posts, rows, embed) for _ in range(n_embedders)], rows, 1),
+                _run(write, [_write_stage(backend.name, rows, write)], None, 0),
+            )
+        finally:
+            reporter.cancel()
+    return stages
+
+# hn_crawl_state key of the largest item id seen by the last poll
+_WATERMARK_KEY = "max_item"
+
+
+def _poll_candidates(watermark: int, max_item: int) -> list[int]:
+    """Item ids created after watermark, followed by the ones updates.json reports changed"""
+    start = watermark + 1
+    if max_item - watermark > settings["CRAWL_POLL_MAX_ITEMS"]:
+        # After a long outage only the newest items are worth a request each
+        start = max_item - settings["CRAWL_POLL_MAX_ITEMS"] + 1
+        logger.warning(f"{max_item - watermark} items since the last poll, skipping to {start}")
+    new_item_ids = list(range(start, max_item + 1))
+    seen = set(new_item_ids)
+    return new_item_ids + [item_id for item_id in fetch_updated_item_ids() if item_id not in seen]
+
+
+def refresh_post_counts(post_ids: list[int]) -> int:
+    """Re-fetch stored posts and update their score and descendants; returns the posts updated"""
+    if not post_ids:
+        return 0
+    posts = asyncio.run(fetch_posts_async(post_ids))
+    return cluster_repo.update_post_counts(posts)
+
+
+def fetch_and_insert(incremental: bool | None = None) -> CrawlStatsModel:
+    """Crawl HN, embed the new posts and store them.
+
+    With CRAWL_MODE "topstories" the first CRAWL_LIMIT top stories are
+    crawled. In incremental mode their IDs are diffed against the stored
+    hn_post_ids first, so known posts are neither fetched nor embedded.
+
+    With CRAWL_MODE "updates" only items created since the stored maxitem
+    watermark and the items updates.json reports changed are fetched, so the
+    requests per run follow the rate of change on HN. Changed posts that are
+    already stored get their score and descendants refreshed instead of being
+    embedded again. The first poll, with no watermark yet, crawls the top
+    stories.
+    """
+    if incremental is None:
+        incremental = settings["CRAWL_INCREMENTAL"]
+    stats = CrawlStatsModel(started_at=datetime.now())
+
+    polling = settings["CRAWL_MODE"] == "updates"
+    watermark = cluster_repo.get_crawl_state(_WATERMARK_KEY) if polling else None
+    max_item = fetch_max_item() if polling else None
+    if watermark is None:
+        post_ids = fetch_top_stories()[:settings["CRAWL_LIMIT"]]
+    else:
+        post_ids = _poll_candidates(watermark, max_item)
+    stats.n_candidates = len(post_ids)
+    if incremental or watermark is not None:
+        known_post_ids = cluster_repo.get_known_post_ids(post_ids)
+        post_ids = [post_id for post_id in post_ids if post_id not in known_post_ids]
+        stats.n_skipped = stats.n_candidates - len(post_ids)
+        if watermark is not None:
+            stats.n_refreshed = refresh_post_counts(sorted(known_post_ids))
+
+    if post_ids:
+        # Runs on its own event loop so the crawl also works from executor threads
+        stats.stages = asyncio.run(crawl_pipeline(post_ids, embedding.get_backend()))
+        fetch, embed, write = stats.stages
+        stats.n_fetched = fetch.n_out
+        stats.n_inserted = write.n_out
+        stats.n_failed = fetch.n_failed + embed.n_failed + write.n_failed
+        for stage in stats.stages:
+            logger.info(
+                f"Stage {stage.name}: {stage.n_in} in, {stage.n_out} out, {stage.n_failed} failed, "
+                f"{stage.throughput:.1f}/s, queue depth max {stage.max_queue_depth} "
+                f"mean {stage.mean_queue_depth:.1f}"
+            )
+    logger.info(
+        f"Fetched {stats.n_fetched}/{len(post_ids)} HN posts, skipped {stats.n_skipped} known posts, "
+        f"refreshed {stats.n_refreshed}"
+    )
+    if max_item is not None:
+        # Items that failed are not retried; changes to them show up in updates.json
+        cluster_repo.set_crawl_state(_WATERMARK_KEY, max_item)
+
+    if stats.n_inserted:
+        try:
+            dedup.dedup_new_posts()
+        except Exception as e:
+            # Posts left unchecked are compared on the next run
+            logger.error(f"Deduplicating new posts failed: {e}")
+        try:
+            vector_index.sync_index()
+        except Exception as e:
+            # The index catches up on the next sync
+            logger.error(f"Syncing the vector index failed: {e}")
+
+    stats.finished_at = datetime.now()
+    cluster_repo.insert_crawl_run(stats)
+    logger.info(f"Crawl finished: {stats.model_dump()}")
+    return stats
@@ -0,0 +1,159 @@
+import numpy as np
+
+from ..config import settings
+from ..infrastructure import quantization
+from ..logger import setup_logger
+from ..repositories.cluster import ClusterRepository
+from . import cluster
+from .embedding import backend_name
+
+logger = setup_logger(__name__)
+
+cluster_repo = ClusterRepository()
+
+
+def _cosine_factors(codes: np.ndarray, scales: np.ndarray | None, block_size: int) -> np.ndarray:
+    """Per-row factors turning dot products of codes into cosine similarities"""
+    factors = np.empty(len(codes), dtype=np.float32)
+    for start, block in quantization.iter_dequantized(codes, scales, block_size):
+        norms = np.linalg.norm(block, axis=1)
+        factors[start:start + len(block)] = 1 / np.where(norms > 0, norms, 1)
+    return factors if scales is None else factors * scales
+
+
+def _best_match(
+    block: np.ndarray, candidates: np.ndarray, factors: np.ndarray, block_size: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return (position, cosine similarity) of each unit row's most similar candidate"""
+    best_positions = np.full(len(block), -1, dtype=np.int64)
+    best_scores = np.full(len(block), -np.inf, dtype=np.float32)
+    rows = np.arange(len(block))
+    # Only a (block_size, block_size) similarity tile is ever materialized
+    for start in range(0, len(candidates), block_size):
+        tile = candidates[start:start + block_size]
+        scores = (block @ tile.astype(np.float32, copy=False).T) * factors[start:start + block_size]
+        positions = scores.argmax(axis=1)
+        top_scores = scores[rows, positions]
+        better = top_scores > best_scores
+        best_positions[better] = start + positions[better]
+        best_scores[better] = top_scores[better]
+    return best_positions, best_scores
+
+
+def _accept_greedily(block_scores: np.ndarray, candidates: np.ndarray, threshold: float) -> np.ndarray:
+    """Mask of the candidates that the in-order greedy pass keeps as canonicals.
+
+    A candidate is kept unless an earlier kept candidate reaches threshold.
+    Instead of walking the block one row at a time, every round settles all
+    candidates whose earlier neighbours are already settled; chains of
+    near-duplicates are short, so a few rounds cover the block.
+    """
+    positions = np.flatnonzero(candidates)
+    # earlier[i, j]: candidate j comes before candidate i and reaches threshold
+    earlier = np.tril(block_scores[np.ix_(positions, positions)] >= threshold, k=-1)
+    kept = np.zeros(len(positions), dtype=bool)
+    undecided = np.ones(len(positions), dtype=bool)
+    while undecided.any():
+        rows = np.flatnonzero(undecided)
+        neighbours = earlier[rows]
+        rejected = neighbours[:, kept].any(axis=1)
+        settled = ~neighbours[:, undecided].any(axis=1)
+        kept[rows[settled & ~rejected]] = True
+        undecided[rows[rejected | settled]] = False
+    accepted = np.zeros(len(candidates), dtype=bool)
+    accepted[positions[kept]] = True
+    return accepted
+
+
+def find_duplicates(
+    vectors: np.ndarray,
+    canonicals: np.ndarray,
+    threshold: float | None = None,
+    block_size: int | None = None,
+    scales: np.ndarray | None = None,
+    canonical_scales: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Greedily collapse `vectors` onto `canonicals` and onto each other.
+
+    Both may be quantization.quantize codes with their scales, or plain
+    float32 vectors, and need not be unit length. They are compared as
+    stored; only one block at a time is converted to float32.
+
+    Vectors are taken in order: each one joins its most similar canonical if
+    the cosine similarity reaches `threshold`, otherwise it becomes a
+    canonical itself. Returns (targets, similarities), where a target below
+    len(canonicals) indexes `canonicals` and len(canonicals) + i means
+    vectors[i]; canonical vectors target themselves with similarity 1.
+    """
+    if threshold is None:
+        threshold = settings["DEDUP_THRESHOLD"]
+    block_size = block_size or settings["DEDUP_BLOCK_SIZE"]
+    n_canonicals = len(canonicals)
+    factors = _cosine_factors(vectors, scales, block_size)
+    canonical_factors = _cosine_factors(canonicals, canonical_scales, block_size)
+    targets = np.arange(n_canonicals, n_canonicals + len(vectors), dtype=np.int64)
+    similarities = np.ones(len(vectors), dtype=np.float32)
+    # Canonicals found in this run as (positions, codes, factors), kept per block to avoid re-copying them
+    new_canonicals: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+
+    for start in range(0, len(vectors), block_size):
+        codes = vectors[start:start + block_size]
+        block = codes.astype(np.float32) * factors[start:start + block_size, None]
+        best_targets, best_scores = _best_match(block, canonicals, canonical_factors, block_size)
+        for positions, accepted, accepted_factors in new_canonicals:
+            accepted_positions, scores = _best_match(block, accepted, accepted_factors, block_size)
+            better = scores > best_scores
+            best_targets[better] = n_canonicals + positions[accepted_positions[better]]
+            best_scores[better] = scores[better]
+
+        # Within the block only earlier vectors that became canonical count
+        block_scores = block @ block.T
+        accepted = _accept_greedily(block_scores, best_scores < threshold, threshold)
+        # Earlier canonicals of the block compete with the matches found above
+        earlier_accepted = np.tril(np.broadcast_to(accepted, block_scores.shape), k=-1)
+        local_scores = np.where(earlier_accepted, block_scores, -np.inf)
+        local_best = local_scores.argmax(axis=1)
+        local_top = local_scores[np.arange(len(block)), local_best]
+        better = local_top > best_scores
+        best_targets[better] = n_canonicals + start + local_best[better]
+        best_scores[better] = local_top[better]
+        duplicates = ~accepted
+        targets[start:start + len(block)][duplicates] = best_targets[duplicates]
+        similarities[start:start + len(block)][duplicates] = best_scores[duplicates]
+
+        if accepted.any():
+            local = np.flatnonzero(accepted)
+            new_canonicals.append((start + local, codes[local], factors[start + local]))
+
+    return targets, similarities
+
+
+def dedup_new_posts() -> int:
+    """Compare posts the dedup stage has not seen against the stored canonicals.
+
+    Only posts of the configured embedding backend are compared. A duplicate
+    only counts while its canonical is in the clustering window, so unseen
+    posts from before the window are recorded as canonical without being
+    compared; this bounds the backlog of a first run over a full database.
+    Returns the number of new posts recorded as near-duplicates.
+    """
+    storage = settings["EMBEDDING_STORAGE"]
+    since = cluster.window_start()
+    if since:
+        cluster_repo.mark_canonical_before(backend_name(), since)
+    embedding_ids, codes, scales = cluster_repo.get_undeduplicated_embedding_matrix(backend_name(), storage, since)
+    if len(embedding_ids) == 0:
+        return 0
+    canonical_ids, canonical_codes, canonical_scales = cluster_repo.get_canonical_embedding_matrix(
+        backend_name(), storage, since
+    )
+
+    targets, similarities = find_duplicates(
+        codes, canonical_codes, scales=scales, canonical_scales=canonical_scales
+    )
+    canonical_ids = np.concatenate((canonical_ids, embedding_ids))[targets]
+    cluster_repo.save_duplicates(embedding_ids, canonical_ids, similarities, since=since)
+
+    n_duplicates = int((canonical_ids != embedding_ids).sum())
+    logger.info(f"Deduplicated {len(embedding_ids)} new posts, found {n_duplicates} near-duplicates")
+    return n_duplicates
@@ -0,0 +1,89 @@
+import numpy as np
+
+from ..config import settings
+from ..repositories.cluster import EMBEDDING_DIM
+from .hf import get_hf_embeddings_batch
+
+
+class EmbeddingBackend:
+    """Turns a batch of texts into a float32 (n, EMBEDDING_DIM) matrix.
+
+    `name` is stored with every embedding the backend writes, so vectors
+    from different backends are never compared or clustered together.
+    """
+
+    name: str
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HFEmbeddingBackend(EmbeddingBackend):
+    """bge-small-en-v1.5 through the HF Inference API"""
+
+    name = "hf"
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        embeddings = get_hf_embeddings_batch(texts)
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), EMBEDDING_DIM)
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """Offline embedder: hashed word uni/bigrams projected to EMBEDDING_DIM.
+
+    Term frequencies are sublinear and English stop words are dropped, which
+    stands in for IDF without keeping corpus statistics; every vector
+    therefore depends on its own text only. The random projection is seeded,
+    so the same text always maps to the same vector, across processes.
+    """
+
+    name = "hashing"
+    n_features = 2 ** 18
+
+    def __init__(self) -> None:
+        # Only this backend needs sklearn, so it is not imported with the module
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.random_projection import SparseRandomProjection
+
+        self.vectorizer = HashingVectorizer(
+            n_features=self.n_features,
+            ngram_range=(1, 2),
+            stop_words="english",
+            alternate_sign=False,
+            norm=None,
+        )
+        # fit only draws the random matrix; it needs the input width, not data
+        self.projection = SparseRandomProjection(
+            n_components=EMBEDDING_DIM, dense_output=True, random_state=0
+        ).fit(np.zeros((1, self.n_features), dtype=np.float32))
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        counts = self.vectorizer.transform(texts)
+        counts.data = 1 + np.log(counts.data)
+        embeddings = self.projection.transform(counts).astype(np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+
+BACKENDS: dict[str, type[EmbeddingBackend]] = {
+    HFEmbeddingBackend.name: HFEmbeddingBackend,
+    HashingEmbeddingBackend.name: HashingEmbeddingBackend,
+}
+
+_backends: dict[str, EmbeddingBackend] = {}
+
+
+def get_backend(name: str | None = None) -> EmbeddingBackend:
+    """Return the backend called name (default: EMBEDDING_BACKEND), created once"""
+    name = name or settings["EMBEDDING_BACKEND"]
+    assert name in BACKENDS, f"Unknown embedding backend {name!r}, expected one of {list(BACKENDS)}"
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+def backend_name() -> str:
+    """Tag of the configured backend, used to filter every embedding read"""
+    name = settings["EMBEDDING_BACKEND"]
+    assert name in BACKENDS, f"Unknown embedding backend {name!r}, expected one of {list(BACKENDS)}"
+    return BACKENDS[name].name
@@ -1,11 +1,25 @@
 import requests
 from ..config import settings, secrets
+from ..infrastructure import metrics
 
-def get_hf_embeddings(text: str) -> list:
+_session = requests.Session()
+
+def get_hf_embeddings_batch(texts: list[str], batch_size: int | None = None) -> list[list]:
+    """Embed many texts with one request per batch, preserving input order"""
     assert "HF_URL" in settings.keys(), "Missing HF_URL"
     assert "HF_API_KEY" in secrets.keys(), "Missing HuggingFace API KEY"
 
+    batch_size = batch_size or settings["EMBEDDING_BATCH_SIZE"]
     headers = {"Authorization": f"Bearer {secrets['HF_API_KEY']}"}
-    text = text.replace("\n", "")
-    resp = requests.post(settings["HF_URL"], headers=headers, json={"inputs": text})
-    return resp.json()
+    embeddings = []
+    for start in range(0, len(texts), batch_size):
+        batch = [text.replace("\n", "") for text in texts[start:start + batch_size]]
+        with metrics.span("hf.get_embeddings"):
+            resp = _session.post(
+                settings["HF_URL"], headers=headers, json={"inputs": batch}, timeout=settings["HF_TIMEOUT"]
+            )
+            resp.raise_for_status()
+        result = resp.json()
+        assert len(result) == len(batch), f"Expected {len(batch)} embeddings, Got: {len(result)}"
+        embeddings.extend(result)
+    return embeddings
@@ -1,14 +1,26 @@
 import json
 import requests
 import re
-from ..config import secrets
+from concurrent.futures import ThreadPoolExecutor
 
+from requests.adapters import HTTPAdapter
+
+from ..config import secrets, settings
+from ..infrastructure import metrics
+
+# Shared keep-alive pool sized for the titling fan-out
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_maxsize=settings["LLM_CONCURRENCY"]))
+_session.mount("http://", HTTPAdapter(pool_maxsize=settings["LLM_CONCURRENCY"]))
+
+@metrics.timed("llm.call")
 def call_llm(messages: list, model: str) -> str:
     assert "OPENROUTER_API_KEY" in secrets.keys(), "Missing OPENROUTER_API_KEY"
+    assert "LLM_URL" in settings.keys(), "Missing LLM_URL"
 
     try:
-        response = requests.post(
-            url="https://openrouter.ai/api/v1/chat/completions",
+        response = _session.post(
+            url=settings["LLM_URL"],
             headers={
                 "Authorization": f"Bearer {secrets['OPENROUTER_API_KEY']}",
             },
@@ -56,3 +68,20 @@ def call_llm(messages: list, model: str) -> str:
 
     except Exception as e:
         raise e
+
+def call_llm_batch(messages_list: list[list], model: str, concurrency: int | None = None) -> list:
+    """Call the LLM for many prompts concurrently, preserving order.
+
+    At most `concurrency` requests are in flight. A failed call yields its
+    exception in place of a result instead of failing the whole batch.
+    """
+    concurrency = concurrency or settings["LLM_CONCURRENCY"]
+
+    def _call(messages: list):
+        try:
+            return call_llm(messages=messages, model=model)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(_call, messages_list))
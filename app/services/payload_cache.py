@@ -0,0 +1,69 @@
+import threading
+from typing import Callable, Optional
+
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_lock = threading.Lock()
+_version = 0
+_payloads: dict[str, dict] = {}
+_payloads_version = -1
+_builder: Optional[Callable[[], dict[str, dict]]] = None
+
+
+def set_builder(builder: Callable[[], dict[str, dict]]) -> None:
+    """Register the function that renders every payload from the database"""
+    global _builder
+    _builder = builder
+
+
+def get_version() -> int:
+    return _version
+
+
+def is_fresh() -> bool:
+    """True when the stored payloads were built for the current version"""
+    return _payloads_version == _version
+
+
+def rebuild(version: int | None = None) -> None:
+    """Render all payloads and store them for `version` (default: current)"""
+    global _payloads, _payloads_version
+    assert _builder is not None, "No payload builder registered."
+    if version is None:
+        version = _version
+    payloads = _builder()
+    with _lock:
+        # A slow rebuild must not overwrite payloads of a newer version
+        if version < _payloads_version:
+            return
+        _payloads = payloads
+        _payloads_version = version
+    logger.info(f"Rebuilt {len(payloads)} payloads for version {version}")
+
+
+def ensure_fresh() -> None:
+    if not is_fresh():
+        rebuild()
+
+
+def invalidate() -> int:
+    """Bump the version after a clustering run and rebuild eagerly if possible"""
+    global _version
+    with _lock:
+        _version += 1
+        version = _version
+    if _builder is not None:
+        rebuild(version)
+    return version
+
+
+def get(key: str) -> Optional[dict]:
+    """Return the payload for key if it belongs to the current version"""
+    # Read the dict and its version together; rebuild swaps both under the lock
+    with _lock:
+        payloads, payloads_version = _payloads, _payloads_version
+    if payloads_version != _version:
+        return None
+    return payloads.get(key)
@@ -0,0 +1,57 @@
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+
+from ..config import settings
+from ..logger import setup_logger
+from ..repositories.cluster import ClusterRepository
+from . import cluster, payload_cache, vector_index
+
+logger = setup_logger(__name__)
+
+cluster_repo = ClusterRepository()
+
+
+def _publish(staging_dir: str, archive_dir: str) -> None:
+    """Move every staged Parquet file to the same relative path in archive_dir"""
+    for root, _, files in os.walk(staging_dir):
+        target_root = os.path.join(archive_dir, os.path.relpath(root, staging_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            os.replace(os.path.join(root, name), os.path.join(target_root, name))
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def archive_old_posts(before: datetime | None = None) -> int:
+    """Move posts older than RETENTION_DAYS and their cluster rows to Parquet.
+
+    Files land in ARCHIVE_DIR/{hn_embeddings,hn_clusters}/created_month=YYYY-MM/
+    and can be read back with read_parquet(..., hive_partitioning=true).
+    They are written to a staging directory first and only published once
+    the rows are deleted from DuckDB. Returns the number of archived posts.
+    """
+    before = before or datetime.now() - timedelta(days=settings["RETENTION_DAYS"])
+    archive_dir = settings["ARCHIVE_DIR"]
+    staging_dir = os.path.join(archive_dir, f".staging-{uuid.uuid4().hex}")
+    os.makedirs(staging_dir)
+    try:
+        n_posts = cluster_repo.export_embeddings_before(before, os.path.join(staging_dir, "hn_embeddings"))
+        if n_posts == 0:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return 0
+        n_clusters = cluster_repo.export_clusters_before(before, os.path.join(staging_dir, "hn_clusters"))
+        # Still-clustered posts leave their centroids before the rows disappear
+        changed_idxs = cluster.expire_old_posts(before)
+        cluster_repo.delete_embeddings_before(before)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    _publish(staging_dir, archive_dir)
+    # Rendered Telegram payloads may still list the archived posts
+    if changed_idxs or n_clusters:
+        payload_cache.invalidate()
+
+    vector_index.rebuild_index()
+    logger.info(f"Archived {n_posts} posts and {n_clusters} cluster rows older than {before} to {archive_dir}")
+    return n_posts
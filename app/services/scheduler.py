@@ -0,0 +1,100 @@
+import random
+import threading
+import time
+
+from ..config import settings
+from ..logger import setup_logger
+from ..models.crawl import CrawlStatsModel
+from ..repositories.cluster import ClusterRepository
+from . import cluster, crawler
+from .embedding import backend_name
+
+logger = setup_logger(__name__)
+
+cluster_repo = ClusterRepository()
+
+# Held for the whole crawl-and-cluster run; a run that finds it taken is skipped
+_run_lock = threading.Lock()
+# time.monotonic() of the last clustering run, None before the first
+_last_clustered_at: float | None = None
+
+
+def next_delay() -> float:
+    """Seconds until the next crawl: CRAWL_INTERVAL spread by ±CRAWL_JITTER.
+
+    Polling runs are cheap when little changed, and updates.json only lists
+    recent changes, so CRAWL_MODE "updates" uses CRAWL_POLL_INTERVAL instead.
+    """
+    jitter = settings["CRAWL_JITTER"]
+    interval = settings["CRAWL_POLL_INTERVAL"] if settings["CRAWL_MODE"] == "updates" else settings["CRAWL_INTERVAL"]
+    return interval * random.uniform(1 - jitter, 1 + jitter)
+
+
+def is_running() -> bool:
+    return _run_lock.locked()
+
+
+def should_recluster(n_changes: int) -> bool:
+    """Whether a clustering run is worth its KMeans and LLM calls.
+
+    True once RECLUSTER_MIN_CHANGES posts changed, or when fewer did but
+    RECLUSTER_MAX_INTERVAL has passed since the last run.
+    """
+    if n_changes >= settings["RECLUSTER_MIN_CHANGES"]:
+        return True
+    if n_changes == 0:
+        return False
+    return _last_clustered_at is None or (
+        time.monotonic() - _last_clustered_at >= settings["RECLUSTER_MAX_INTERVAL"]
+    )
+
+
+def recluster(**kwargs) -> None:
+    """Run cluster.execute_cluster and record when it ran"""
+    global _last_clustered_at
+    cluster.execute_cluster(**kwargs)
+    _last_clustered_at = time.monotonic()
+
+
+def _recluster_if_changed() -> bool:
+    """Recluster when should_recluster says so; the caller holds _run_lock"""
+    n_changes = cluster_repo.count_pending_cluster_changes(
+        since=cluster.window_start(), backend=backend_name()
+    )
+    if not should_recluster(n_changes):
+        logger.info(f"{n_changes} posts changed since the last clustering run, skipping")
+        return False
+    logger.info(f"{n_changes} posts changed since the last clustering run, reclustering")
+    recluster()
+    return True
+
+
+def recluster_if_needed() -> bool:
+    """Recluster without crawling, under the same lock and thresholds as run_once.
+
+    Returns whether clustering ran; False also when a run is in progress.
+    """
+    if not _run_lock.acquire(blocking=False):
+        logger.info("A crawl or clustering run is in progress, skipping this one")
+        return False
+    try:
+        return _recluster_if_changed()
+    finally:
+        _run_lock.release()
+
+
+def run_once() -> CrawlStatsModel | None:
+    """Crawl, then recluster if enough posts changed.
+
+    Blocking; meant for the background executor. Returns None without doing
+    anything while another run is in progress.
+    """
+    if not _run_lock.acquire(blocking=False):
+        logger.info("Previous crawl is still running, skipping this one")
+        return None
+    try:
+        stats = crawler.fetch_and_insert()
+        _recluster_if_changed()
+        return stats
+    finally:
+        _run_lock.release()
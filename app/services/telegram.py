@@ -1,20 +1,23 @@
-from ..repositories.cluster import ClusterRepository
 from ..models.cluster import ClusterDisplayModel
-from . import cluster
+from . import cluster, payload_cache
 
-cluster_repo = ClusterRepository()
+HOT_NEWS_KEY = "hot_news"
+CLUSTER_POSTS_LIMIT = 10
+
+def build_payloads() -> dict[str, dict]:
+    """Render the hot news keyboard and every cluster's keyboard from one read"""
+    cluster_data = cluster.get_cluster_display_data(limit=CLUSTER_POSTS_LIMIT)
+    payloads = {HOT_NEWS_KEY: format_clusters_for_inline_buttons(cluster_data)}
+    for item in cluster_data:
+        payloads[f"cluster_{item.cluster_idx}"] = format_posts_for_inline_buttons(item.posts)
+    return payloads
+
+payload_cache.set_builder(build_payloads)
 
 def get_telegram_hot_news() -> dict:
     """Get hot news clusters formatted for Telegram inline buttons"""
-    clusters = cluster_repo.get_clusters()
-    # if len(clusters) == 0:
-    #     return {
-    #         "text": "There aren't any hot news recently.",
-    #         "reply_markup": {"inline_keyboard": []}
-    #     }
-    
-    cluster_data = cluster.get_cluster_display_data()
-    return format_clusters_for_inline_buttons(cluster_data)
+    payload_cache.ensure_fresh()
+    return payload_cache.get(HOT_NEWS_KEY) or format_clusters_for_inline_buttons([])
 
 def format_clusters_for_inline_buttons(clusters: list[ClusterDisplayModel]) -> dict:
     """Format cluster data for Telegram inline keyboard"""
@@ -23,7 +26,7 @@ def format_clusters_for_inline_buttons(clusters: list[ClusterDisplayModel]) -> d
             "text": "There aren't any hot news recently.",
             "reply_markup": {"inline_keyboard": []}
         }
-    
+
     inline_keyboard = []
     for cluster in clusters:
         button = {
@@ -31,22 +34,20 @@ def format_clusters_for_inline_buttons(clusters: list[ClusterDisplayModel]) -> d
             "callback_data": f"cluster_{cluster.cluster_idx}"
         }
         inline_keyboard.append([button])
-    
+
     return {
         "text": "🔥 Hot News Clusters:",
         "reply_markup": {"inline_keyboard": inline_keyboard}
     }
 
-def get_telegram_cluster_posts(cluster_idx: int) -> dict:
-    """Get posts for a specific cluster formatted for Telegram inline buttons"""
-    posts = cluster_repo.get_posts_by_cluster_idx(cluster_idx, limit=10)
-    
+def format_posts_for_inline_buttons(posts: list[dict]) -> dict:
+    """Format a cluster's posts for Telegram inline keyboard"""
     if not posts:
         return {
             "text": "No posts found for this cluster.",
             "reply_markup": {"inline_keyboard": []}
         }
-    
+
     # Create inline keyboard with posts
     inline_keyboard = []
     for post in posts:
@@ -56,17 +57,39 @@ def get_telegram_cluster_posts(cluster_idx: int) -> dict:
             "url": post["url"]
         }
         inline_keyboard.append([button])
-    
+
     # Add back button
     inline_keyboard.append([
         {"text": "🔙 Back to clusters", "callback_data": "back_to_clusters"}
     ])
-    
+
     return {
         "text": f"📰 Posts in cluster:",
         "reply_markup": {"inline_keyboard": inline_keyboard}
     }
 
+def format_similar_posts(hn_post_id: int, posts: list[dict] | None) -> dict:
+    """Format posts related to an HN post for Telegram inline keyboard"""
+    if posts is None:
+        text = f"Post {hn_post_id} has not been crawled yet."
+    elif not posts:
+        text = f"No similar posts found for {hn_post_id}."
+    else:
+        text = f"🔗 Posts similar to {hn_post_id}:"
+    inline_keyboard = [
+        [{"text": post["title"][:50] + "..." if len(post["title"]) > 50 else post["title"], "url": post["url"]}]
+        for post in posts or []
+    ]
+    return {
+        "text": text,
+        "reply_markup": {"inline_keyboard": inline_keyboard}
+    }
+
+def get_telegram_cluster_posts(cluster_idx: int) -> dict:
+    """Get posts for a specific cluster formatted for Telegram inline buttons"""
+    payload_cache.ensure_fresh()
+    return payload_cache.get(f"cluster_{cluster_idx}") or format_posts_for_inline_buttons([])
+
 def handle_telegram_callback(callback_data: str) -> dict:
     """Handle Telegram callback queries"""
     if callback_data.startswith("cluster_"):
@@ -0,0 +1,389 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from ..config import settings
+from ..infrastructure import quantization
+from ..infrastructure.vectors import normalize
+from ..logger import setup_logger
+from ..repositories.cluster import EMBEDDING_DIM, ClusterRepository
+from .embedding import backend_name
+
+logger = setup_logger(__name__)
+
+cluster_repo = ClusterRepository()
+
+# File in the index directory naming the version subdirectory that is live
+CURRENT_FILE = "CURRENT"
+
+
+class VectorIndex:
+    """IVF (inverted file) index for cosine similarity over post embeddings.
+
+    Vectors are partitioned by their nearest coarse centroid and stored
+    contiguously per list, so a query only scans the `nprobe` closest lists.
+    Vectors added after the last build go to a small delta segment that is
+    scanned exactly, and are merged into the lists on the next rebuild. The
+    main segment is kept as `storage` codes (see quantization.quantize),
+    persisted as .npy files and memory-mapped on load. Every save goes to a
+    fresh version subdirectory that CURRENT_FILE is then switched to; the
+    main segment files are hard-linked from the previous version unless a
+    rebuild changed them.
+    """
+
+    def __init__(self, path: str, storage: str | None = None) -> None:
+        self.path = path
+        self.storage = storage or settings["EMBEDDING_STORAGE"]
+        self.centroids = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self.list_offsets = np.zeros(1, dtype=np.int64)
+        self.main_vectors = np.empty((0, EMBEDDING_DIM), dtype=quantization.STORAGE_DTYPES[self.storage])
+        self.main_scales: np.ndarray | None = None
+        self.main_ids = np.empty(0, dtype=np.int64)
+        self.delta_vectors = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self.delta_ids = np.empty(0, dtype=np.int64)
+        self.max_id = 0
+        # Version directory already holding the current main segment, if any
+        self._main_version: str | None = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.main_ids) + len(self.delta_ids)
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray, nlist: int | None = None) -> None:
+        """Train coarse centroids and lay out every vector by list.
+
+        Training runs without the lock, so searches keep answering from the
+        previous layout until the new one is swapped in.
+        """
+        layout = self._layout(ids, vectors, nlist)
+        with self._lock:
+            self._install(layout, np.empty(0, dtype=np.int64), np.empty((0, EMBEDDING_DIM), dtype=np.float32))
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Append vectors to the delta segment, rebuilding once it grows too large"""
+        if len(ids) == 0:
+            return
+        with self._lock:
+            self.delta_ids = np.concatenate((self.delta_ids, np.asarray(ids, dtype=np.int64)))
+            self.delta_vectors = np.concatenate((self.delta_vectors, normalize(vectors)))
+            self.max_id = max(self.max_id, int(np.max(ids)))
+            too_large = len(self.delta_ids) > max(
+                settings["VECTOR_INDEX_MAX_DELTA"], settings["VECTOR_INDEX_DELTA_RATIO"] * len(self.main_ids)
+            )
+        if too_large:
+            self.rebuild()
+
+    def rebuild(self) -> None:
+        """Re-train the lists over main and delta vectors.
+
+        Vectors added while training stay in the delta segment of the new layout.
+        """
+        with self._lock:
+            # Segments are replaced, never mutated in place, so these references stay valid
+            main_vectors, main_scales, main_ids = self.main_vectors, self.main_scales, self.main_ids
+            delta_vectors, delta_ids = self.delta_vectors, self.delta_ids
+        ids = np.concatenate((main_ids, delta_ids))
+        vectors = np.concatenate((quantization.dequantize(np.asarray(main_vectors), main_scales), delta_vectors))
+        layout = self._layout(ids, vectors)
+        with self._lock:
+            self._install(layout, self.delta_ids[len(delta_ids):], self.delta_vectors[len(delta_ids):])
+
+    def _layout(self, ids: np.ndarray, vectors: np.ndarray, nlist: int | None = None) -> dict:
+        vectors = normalize(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        nlist = nlist or max(1, min(len(ids), int(settings["VECTOR_INDEX_LISTS_PER_SQRT"] * np.sqrt(len(ids)))))
+        if len(ids) == 0:
+            centroids = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+            assignments = np.empty(0, dtype=np.int64)
+        else:
+            # Imported here so serving /similar from a saved index never loads sklearn
+            from sklearn.cluster import MiniBatchKMeans
+
+            rng = np.random.default_rng(0)
+            # Centroids only need a sample; the assignment below covers everything
+            sample_size = min(len(ids), max(nlist * 64, 10000))
+            sample = vectors[rng.choice(len(ids), sample_size, replace=False)]
+            kmeans = MiniBatchKMeans(n_clusters=nlist, n_init=1, random_state=0).fit(sample)
+            centroids = normalize(kmeans.cluster_centers_)
+            assignments = self._assign(vectors, centroids)
+
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=len(centroids))
+        # Quantized after normalizing, so int8 scales stay close to 1/127
+        codes, scales = quantization.quantize(vectors[order], self.storage)
+        logger.info(f"Built vector index with {len(ids)} vectors in {len(centroids)} lists")
+        return {
+            "centroids": centroids,
+            "list_offsets": np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            "main_vectors": np.ascontiguousarray(codes),
+            "main_scales": scales,
+            "main_ids": ids[order],
+        }
+
+    def _install(self, layout: dict, delta_ids: np.ndarray, delta_vectors: np.ndarray) -> None:
+        """Swap in a new main segment; the caller holds the lock"""
+        self.centroids = layout["centroids"]
+        self.list_offsets = layout["list_offsets"]
+        self.main_vectors = layout["main_vectors"]
+        self.main_scales = layout["main_scales"]
+        self.main_ids = layout["main_ids"]
+        self.delta_vectors = delta_vectors
+        self.delta_ids = delta_ids
+        self.max_id = int(max(self.main_ids.max(initial=0), delta_ids.max(initial=0)))
+        # The new main segment has not been written to any version yet
+        self._main_version = None
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Return (ids, cosine scores) of the k nearest vectors, best first"""
+        query = normalize(query)
+        nprobe = nprobe or settings["VECTOR_INDEX_NPROBE"]
+        with self._lock:
+            candidate_ids = [self.delta_ids]
+            candidate_scores = [self.delta_vectors @ query]
+            if len(self.centroids):
+                centroid_scores = self.centroids @ query
+                if nprobe < len(self.centroids):
+                    probes = np.argpartition(-centroid_scores, nprobe)[:nprobe]
+                else:
+                    probes = np.arange(len(self.centroids))
+                for probe in probes:
+                    start, end = self.list_offsets[probe], self.list_offsets[probe + 1]
+                    if start == end:
+                        continue
+                    candidate_ids.append(self.main_ids[start:end])
+                    scales = None if self.main_scales is None else self.main_scales[start:end]
+                    candidate_scores.append(quantization.dot(self.main_vectors[start:end], scales, query))
+
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        if len(ids) > k:
+            top = np.argpartition(-scores, k)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores)
+        return ids[order], scores[order]
+
+    def save(self) -> None:
+        """Persist atomically: all files go to a new version directory, then CURRENT_FILE is swapped.
+
+        A crash at any point leaves the previous version live and complete,
+        never a mix of arrays from different builds.
+        """
+        version = f"v{time.time_ns()}"
+        version_dir = os.path.join(self.path, version)
+        os.makedirs(version_dir)
+        with self._lock:
+            main_arrays = {
+                "centroids": self.centroids,
+                "list_offsets": self.list_offsets,
+                "main_vectors": np.asarray(self.main_vectors),
+                "main_ids": np.asarray(self.main_ids),
+            }
+            if self.main_scales is not None:
+                main_arrays["main_scales"] = self.main_scales
+            delta_arrays = {"delta_vectors": self.delta_vectors, "delta_ids": self.delta_ids}
+            meta = {"dim": EMBEDDING_DIM, "max_id": self.max_id, "size": len(self), "storage": self.storage}
+            main_version, main_ids = self._main_version, self.main_ids
+        for name, array in main_arrays.items():
+            if not self._link_main(main_version, version_dir, f"{name}.npy"):
+                np.save(os.path.join(version_dir, f"{name}.npy"), array)
+        for name, array in delta_arrays.items():
+            np.save(os.path.join(version_dir, f"{name}.npy"), array)
+        with open(os.path.join(version_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        # Flushed before the switch, so CURRENT_FILE never names a partly written version
+        for name in os.listdir(version_dir):
+            with open(os.path.join(version_dir, name), "rb") as f:
+                os.fsync(f.fileno())
+        tmp_path = os.path.join(self.path, f"{CURRENT_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, CURRENT_FILE))
+        with self._lock:
+            # Unless a rebuild swapped main in the meantime, the next save can link from here
+            if self.main_ids is main_ids:
+                self._main_version = version
+        # Earlier versions and the pre-versioning flat layout; open memory maps survive the unlink
+        for name in os.listdir(self.path):
+            if name in (version, CURRENT_FILE):
+                continue
+            entry = os.path.join(self.path, name)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                os.remove(entry)
+
+    def _link_main(self, main_version: str | None, version_dir: str, filename: str) -> bool:
+        """Hard-link an unchanged main segment file from main_version; False when it must be written"""
+        if main_version is None:
+            return False
+        try:
+            os.link(os.path.join(self.path, main_version, filename), os.path.join(version_dir, filename))
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, CURRENT_FILE)) or os.path.exists(os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        """Load the live version; raises ValueError when its arrays do not match each other or meta"""
+        current_path = os.path.join(path, CURRENT_FILE)
+        if os.path.exists(current_path):
+            with open(current_path) as f:
+                version_dir = os.path.join(path, f.read().strip())
+        else:
+            # Saved before versioning: files directly in path
+            version_dir = path
+        with open(os.path.join(version_dir, "meta.json")) as f:
+            meta = json.load(f)
+        # Indexes saved before compact storage hold float32 vectors
+        index = cls(path, meta.get("storage", "float32"))
+        assert meta["dim"] == EMBEDDING_DIM, f"Index dimension {meta['dim']} != {EMBEDDING_DIM}"
+        index.centroids = np.load(os.path.join(version_dir, "centroids.npy"))
+        index.list_offsets = np.load(os.path.join(version_dir, "list_offsets.npy"))
+        # The large segment stays on disk and is paged in on demand
+        index.main_vectors = np.load(os.path.join(version_dir, "main_vectors.npy"), mmap_mode="r")
+        index.main_ids = np.load(os.path.join(version_dir, "main_ids.npy"), mmap_mode="r")
+        if index.storage == "int8":
+            index.main_scales = np.load(os.path.join(version_dir, "main_scales.npy"))
+        index.delta_vectors = np.load(os.path.join(version_dir, "delta_vectors.npy"))
+        index.delta_ids = np.load(os.path.join(version_dir, "delta_ids.npy"))
+        index.max_id = meta["max_id"]
+        index._check(meta["size"])
+        if version_dir != path:
+            index._main_version = os.path.basename(version_dir)
+        return index
+
+    def _check(self, size: int) -> None:
+        n_main = len(self.main_ids)
+        consistent = (
+            len(self) == size
+            and len(self.main_vectors) == n_main
+            and len(self.list_offsets) == len(self.centroids) + 1
+            and int(self.list_offsets[-1]) == n_main
+            and len(self.delta_vectors) == len(self.delta_ids)
+            and (self.main_scales is None or len(self.main_scales) == n_main)
+        )
+        if not consistent:
+            raise ValueError(f"Vector index at {self.path} is inconsistent with its meta.json")
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 16384) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            assignments[start:start + chunk_size] = (vectors[start:start + chunk_size] @ centroids.T).argmax(axis=1)
+        return assignments
+
+
+_index: VectorIndex | None = None
+_index_lock = threading.Lock()
+
+
+def _index_path() -> str:
+    # One index per embedding backend; their vectors are not comparable
+    return os.path.join(settings["ARTIFACT_DIR"], "vector_index", backend_name())
+
+
+def _load(path: str) -> VectorIndex | None:
+    if not VectorIndex.exists(path):
+        return None
+    try:
+        index = VectorIndex.load(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Discarding unreadable vector index at {path}: {e}")
+        return None
+    # An index saved under another EMBEDDING_STORAGE is rebuilt too
+    return index if index.storage == settings["EMBEDDING_STORAGE"] else None
+
+
+def get_index(build: bool = True) -> VectorIndex | None:
+    """Load the persisted index, or build it from the stored embeddings.
+
+    Building trains MiniBatchKMeans over every post, so request handlers
+    pass build=False and get None until the crawl or the startup job
+    (sync_index) has built it; they never wait for a build in progress.
+    """
+    global _index
+    path = _index_path()
+    index = _index
+    if index is not None and index.path == path:
+        return index
+    if not build:
+        if not _index_lock.acquire(blocking=False):
+            return None
+        try:
+            if _index is None or _index.path != path:
+                index = _load(path)
+                if index is not None:
+                    _index = index
+            return _index if _index is not None and _index.path == path else None
+        finally:
+            _index_lock.release()
+    with _index_lock:
+        if _index is None or _index.path != path:
+            index = _load(path)
+            if index is None:
+                index = VectorIndex(path)
+                ids, vectors = cluster_repo.get_embedding_matrix(backend=backend_name())
+                index.build(ids, vectors)
+                index.save()
+            # Pick up rows written since the index was persisted; may rebuild
+            _sync(index)
+            _index = index
+    return _index
+
+
+def rebuild_index() -> VectorIndex:
+    """Rebuild the index from the live table, e.g. after rows were archived.
+
+    The new index is built on the side and swapped in, so /similar keeps
+    answering from the old one meanwhile.
+    """
+    global _index
+    index = VectorIndex(_index_path())
+    ids, vectors = cluster_repo.get_embedding_matrix(backend=backend_name())
+    index.build(ids, vectors)
+    index.save()
+    _index = index
+    return index
+
+
+def _sync(index: VectorIndex) -> int:
+    added = 0
+    for ids, vectors in cluster_repo.iter_embedding_chunks(min_id=index.max_id, backend=backend_name()):
+        index.add(ids, vectors)
+        added += len(ids)
+    if added:
+        index.save()
+    return added
+
+
+def sync_index() -> int:
+    """Add embeddings inserted since the last sync; returns the number added"""
+    index = get_index()
+    added = _sync(index)
+    logger.info(f"Synced {added} new vectors into the index ({len(index)} total)")
+    return added
+
+
+def similar_posts(hn_post_id: int, k: int = 5) -> list[dict] | None:
+    """Posts most similar to the given HN post, or None if the post is unknown"""
+    record = cluster_repo.get_embedding_by_post_id(hn_post_id, backend_name())
+    if record is None:
+        return None
+    embedding_id, embedding = record
+    index = get_index(build=False)
+    if index is None:
+        logger.warning("Vector index is not built yet, answering /similar with no posts")
+        return []
+    ids, _ = index.search(embedding, k=k + 1)
+    similar_ids = [int(i) for i in ids if i != embedding_id][:k]
+    return cluster_repo.get_posts_by_ids(similar_ids)
@@ -0,0 +1,77 @@
+"""Compare the N+1 cluster display read path with the single windowed query.
+
+Run with: python -m benchmarks.bench_cluster_display
+"""
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app.repositories.cluster import EMBEDDING_DIM, ClusterRepository
+from app.services import cluster
+
+POSTS_PER_CLUSTER = 50
+N_CLUSTERS = [5, 20, 100, 500]
+REPEATS = 20
+
+
+def _seed(repo: ClusterRepository, n_clusters: int) -> None:
+    repo.create_embeddings_table()
+    repo.create_cluster_table()
+    repo.create_cluster_title_table()
+    n_posts = n_clusters * POSTS_PER_CLUSTER
+    rng = np.random.default_rng(0)
+    embeddings = rng.random((n_posts, EMBEDDING_DIM), dtype=np.float32)
+    repo.bulk_insert_into_embeddings_table([
+        {
+            "title": f"Post {i}",
+            "url": f"https://example.com/{i}",
+            "hn_post_id": i,
+            "embedding": embeddings[i],
+            "created_at": datetime.now(),
+        }
+        for i in range(n_posts)
+    ])
+    embedding_ids, _ = repo.get_embedding_matrix()
+    repo.bulk_insert_to_cluster_table(embedding_ids, rng.integers(0, n_clusters, n_posts))
+    repo.insert_to_cluster_title_table([[i, f"Cluster title {i}"] for i in range(n_clusters)])
+
+
+def _n_plus_one(repo: ClusterRepository) -> list:
+    """The read path get_cluster_display_data used before the windowed query"""
+    cluster_data = []
+    for cluster_idx in repo.get_unqiue_cluster_idx():
+        cursor = repo.conn.cursor()
+        title_result = cursor.execute(
+            "SELECT title FROM hn_cluster_titles WHERE hn_cluster_idx = ?", [cluster_idx]
+        ).fetchone()
+        posts = repo.get_posts_by_cluster_idx(cluster_idx, limit=5)
+        cluster_data.append((cluster_idx, title_result[0] if title_result else None, posts))
+    return cluster_data
+
+
+def _time_ms(fn) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def main() -> None:
+    print(f"{'clusters':>8} {'n+1 (ms)':>10} {'windowed (ms)':>14}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_clusters in N_CLUSTERS:
+            repo = ClusterRepository(os.path.join(tmp_dir, f"bench_{n_clusters}.duckdb"))
+            _seed(repo, n_clusters)
+            # get_cluster_display_data reads through the module-level repository
+            cluster.cluster_repo = repo
+            n_plus_one_ms = _time_ms(lambda: _n_plus_one(repo))
+            windowed_ms = _time_ms(cluster.get_cluster_display_data)
+            print(f"{n_clusters:>8} {n_plus_one_ms:>10.2f} {windowed_ms:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
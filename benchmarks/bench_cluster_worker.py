@@ -0,0 +1,61 @@
+"""Event-loop responsiveness while KMeans runs, in a thread vs in the worker process.
+
+A bot handler stands in as a coroutine that wakes every TICK seconds; its
+lateness is the delay a Telegram update would see. The fit runs through
+run_blocking in the background executor, as cluster_job does.
+
+Run with: python -m benchmarks.bench_cluster_worker [n_posts]
+"""
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.infrastructure.executor import background_executor, run_blocking
+from app.services import cluster_worker
+
+from . import corpus
+
+TICK = 0.005
+
+
+async def _measure(embeddings: np.ndarray, n_clusters: int) -> tuple[float, list[float]]:
+    lags = []
+    fit = asyncio.ensure_future(
+        run_blocking(cluster_worker.fit_kmeans, embeddings, n_clusters, executor=background_executor)
+    )
+    start = time.perf_counter()
+    while not fit.done():
+        before = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - before - TICK)
+    await fit
+    return time.perf_counter() - start, lags
+
+
+def main() -> None:
+    n_posts = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_topics = corpus.n_topics_for(n_posts)
+    rng = np.random.default_rng(0)
+    embeddings = corpus.generate_embeddings(rng.integers(0, n_topics, n_posts), corpus.topic_centres(n_topics), rng)
+    n_clusters = settings["N_CLUSTERS"]
+    # Start the worker (and its sklearn import) outside the measurement
+    settings["CLUSTER_IN_WORKER"] = True
+    cluster_worker.fit_kmeans(embeddings[:1000], n_clusters)
+
+    print(f"{'mode':>8} {'fit (s)':>8} {'lag p50 (ms)':>13} {'lag p99 (ms)':>13} {'lag max (ms)':>13}")
+    for in_worker in (False, True):
+        settings["CLUSTER_IN_WORKER"] = in_worker
+        seconds, lags = asyncio.run(_measure(embeddings, n_clusters))
+        lags_ms = np.asarray(lags) * 1000
+        print(
+            f"{'worker' if in_worker else 'thread':>8} {seconds:>8.2f} {np.percentile(lags_ms, 50):>13.2f} "
+            f"{np.percentile(lags_ms, 99):>13.2f} {lags_ms.max():>13.2f}"
+        )
+    cluster_worker.shutdown()
+
+
+if __name__ == "__main__":
+    main()
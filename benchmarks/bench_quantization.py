@@ -0,0 +1,90 @@
+"""Compact embedding storage: size, scan time and accuracy per EMBEDDING_STORAGE mode.
+
+For every mode a fresh database is seeded with the same synthetic corpus.
+Accuracy is measured against float32 on that corpus: the share of posts whose
+nearest centroid (of centroids fitted on float32) changes, and recall@10 of
+the similarity index against an exact float32 search.
+
+Run with: python -m benchmarks.bench_quantization [n_posts]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.infrastructure import duckdb_connection, quantization
+from app.infrastructure.vectors import normalize
+from app.repositories.cluster import ClusterRepository
+from app.services.cluster import _nearest_centroids
+from app.services.vector_index import VectorIndex
+
+from . import corpus
+
+N_QUERIES = 200
+K = 10
+
+
+def _recall(index: VectorIndex, vectors: np.ndarray, queries: np.ndarray) -> float:
+    """Mean share of the exact float32 top K that index.search also returns"""
+    hits = 0
+    for query in queries:
+        exact = np.argpartition(-(vectors @ query), K)[:K]
+        hits += len(np.intersect1d(index.search(query, k=K)[0], exact))
+    return hits / (K * len(queries))
+
+
+def main() -> None:
+    from sklearn.cluster import KMeans
+
+    n_posts = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rng = np.random.default_rng(0)
+    reference = None
+
+    print(
+        f"{'storage':>8} {'db (MiB)':>9} {'matrix (MiB)':>13} {'scan (ms)':>10} "
+        f"{'reassigned':>11} {'recall@10':>10}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for storage in quantization.STORAGE_DTYPES:
+            settings["EMBEDDING_STORAGE"] = storage
+            db_path = os.path.join(tmp_dir, f"{storage}.duckdb")
+            repo = ClusterRepository(db_path)
+            corpus.seed_database(repo, n_posts)
+            with repo.manager.writer() as cursor:
+                cursor.execute("CHECKPOINT")
+
+            start = time.perf_counter()
+            ids, codes, scales = repo.get_compact_embedding_matrix(storage=storage)
+            scan_s = time.perf_counter() - start
+            duckdb_connection.close_all()
+
+            embeddings = quantization.dequantize(codes, scales)
+            if reference is None:
+                # float32 runs first and is the baseline for the other modes
+                centroids = KMeans(n_clusters=settings["N_CLUSTERS"], random_state=0).fit(embeddings).cluster_centers_
+                reference = {
+                    "ids": ids,
+                    "positions": _nearest_centroids(embeddings, centroids.astype(np.float32)),
+                    "vectors": normalize(embeddings),
+                    "queries": normalize(embeddings[rng.choice(len(ids), N_QUERIES, replace=False)]),
+                }
+            assert np.array_equal(ids, reference["ids"]), "Every mode must store the same posts"
+
+            positions = _nearest_centroids(codes, centroids.astype(np.float32), scales=scales)
+            index = VectorIndex(os.path.join(tmp_dir, f"index-{storage}"), storage)
+            index.build(ids, reference["vectors"])
+            # Positions double as ids so exact matches line up with index results
+            index.main_ids = np.searchsorted(ids, index.main_ids)
+            matrix_bytes = codes.nbytes + (0 if scales is None else scales.nbytes)
+            print(
+                f"{storage:>8} {os.path.getsize(db_path) / 2**20:>9.1f} {matrix_bytes / 2**20:>13.1f} "
+                f"{scan_s * 1000:>10.0f} {np.mean(positions != reference['positions']):>10.2%} "
+                f"{_recall(index, reference['vectors'], reference['queries']):>10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
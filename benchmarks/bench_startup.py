@@ -0,0 +1,124 @@
+"""Bot startup: import-time profile of `main` and time to the first /hotnews response.
+
+Each measurement runs in a fresh interpreter, so nothing is cached from the
+benchmark process. Time to first response counts from spawning the
+interpreter to the hot news payload being rendered from a seeded database,
+i.e. interpreter start, imports, init_app and the first render.
+
+Run with: python -m benchmarks.bench_startup [n_posts]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPEATS = 3
+TOP_IMPORTS = 8
+
+# Runs in the child interpreter; settings must be patched before any repository is created
+_FIRST_RESPONSE = """
+import asyncio, json, sys, time
+from app.config import settings
+settings.update(DB_PATH=sys.argv[1], ARTIFACT_DIR=sys.argv[2], SNAPSHOT_PATH=None)
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.init_app()
+initialized = time.perf_counter()
+response = asyncio.run(main.render_payload("hot_news", main.get_telegram_hot_news))
+print(json.dumps({
+    "responded_at": time.time(),
+    "import_s": imported - start,
+    "init_s": initialized - imported,
+    "render_s": time.perf_counter() - initialized,
+    "n_clusters": len(response["reply_markup"]["inline_keyboard"]),
+    "sklearn_loaded": "sklearn" in sys.modules,
+}))
+"""
+
+
+def profile_imports(module: str = "main") -> tuple[float, list[tuple[str, float]]]:
+    """Return (seconds to import module, heaviest direct imports) via -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    direct = []
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        seconds = int(cumulative) / 1e6
+        if name.strip() == module:
+            total = seconds
+        # Two spaces of indent: imported by `module` itself
+        elif name.startswith("   ") and not name.startswith("    "):
+            direct.append((name.strip(), seconds))
+    return total, sorted(direct, key=lambda item: -item[1])[:TOP_IMPORTS]
+
+
+def time_first_response(db_path: str, artifact_dir: str) -> dict:
+    spawned_at = time.time()
+    result = subprocess.run(
+        [sys.executable, "-c", _FIRST_RESPONSE, db_path, artifact_dir],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["first_response_s"] = timings.pop("responded_at") - spawned_at
+    return timings
+
+
+def bench_startup(db_path: str, artifact_dir: str) -> dict:
+    """Median startup metrics over REPEATS runs; db_path must not be open in this process"""
+    imports = [profile_imports()[0] for _ in range(REPEATS)]
+    runs = [time_first_response(db_path, artifact_dir) for _ in range(REPEATS)]
+    return {
+        "import_main_s": round(float(np.median(imports)), 3),
+        "first_response_s": round(float(np.median([run["first_response_s"] for run in runs])), 3),
+        "first_render_ms": round(float(np.median([run["render_s"] for run in runs])) * 1000, 3),
+    }
+
+
+def main() -> None:
+    from app.config import settings
+    from app.infrastructure import duckdb_connection
+    from app.services import cluster
+
+    from . import corpus
+    from .stubs import StubServer
+    from .suite import _use_database
+
+    n_posts = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    total, heaviest = profile_imports()
+    print(f"import main: {total * 1000:.0f} ms")
+    for name, seconds in heaviest:
+        print(f"  {name:<32} {seconds * 1000:8.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp_dir, StubServer() as stub:
+        stub.configure()
+        settings.update(ARTIFACT_DIR=tmp_dir, SNAPSHOT_PATH=None)
+        db_path = os.path.join(tmp_dir, "startup.duckdb")
+        repo = _use_database(db_path)
+        corpus.seed_database(repo, n_posts)
+        cluster.fit_clusters(auto=False)
+        cluster.generate_cluster_titles(list(range(settings["N_CLUSTERS"])))
+        # The child process needs the file lock
+        duckdb_connection.close_all()
+
+        timings = time_first_response(db_path, tmp_dir)
+    print(
+        f"first /hotnews response after {timings['first_response_s'] * 1000:.0f} ms "
+        f"(import {timings['import_s'] * 1000:.0f} ms, init_app {timings['init_s'] * 1000:.0f} ms, "
+        f"render {timings['render_s'] * 1000:.0f} ms, {timings['n_clusters']} clusters), "
+        f"sklearn loaded: {timings['sklearn_loaded']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Compare the IVF vector index with a brute-force scan: recall@k and query latency.
+
+Embeddings come from the synthetic corpus (see benchmarks/corpus.py),
+whose topic structure mimics sentence embeddings far better than uniform
+noise.
+
+Run with: python -m benchmarks.bench_vector_index [n_vectors ...]
+e.g.      python -m benchmarks.bench_vector_index 10000 100000 1000000
+"""
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app.infrastructure.vectors import normalize
+from app.repositories.cluster import EMBEDDING_DIM
+from app.services.vector_index import VectorIndex
+
+from . import corpus
+
+N_VECTORS = [10_000, 100_000]
+N_QUERIES = 200
+K = 10
+NPROBES = [4, 16, 64]
+
+
+def _brute_force(vectors: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = vectors @ query
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or N_VECTORS
+    rng = np.random.default_rng(0)
+    print(f"{'vectors':>9} {'build (s)':>10} {'method':>12} {'recall@10':>10} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for n in sizes:
+        n_topics = corpus.n_topics_for(n)
+        vectors = corpus.generate_embeddings(
+            rng.integers(0, n_topics, n), corpus.topic_centres(n_topics), rng
+        )
+        ids = np.arange(n, dtype=np.int64)
+        queries = normalize(
+            vectors[rng.integers(0, n, N_QUERIES)]
+            + 0.1 * rng.standard_normal((N_QUERIES, EMBEDDING_DIM), dtype=np.float32)
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index = VectorIndex(tmp_dir)
+            start = time.perf_counter()
+            index.build(ids, vectors)
+            build_s = time.perf_counter() - start
+            # Query the memory-mapped copy, as the bot does after a restart
+            index.save()
+            index = VectorIndex.load(tmp_dir)
+
+            truth, brute_ms = [], []
+            for query in queries:
+                start = time.perf_counter()
+                truth.append(set(_brute_force(vectors, query, K).tolist()))
+                brute_ms.append((time.perf_counter() - start) * 1000)
+            print(f"{n:>9} {'':>10} {'brute-force':>12} {1.0:>10.3f} "
+                  f"{np.percentile(brute_ms, 50):>9.2f} {np.percentile(brute_ms, 99):>9.2f}")
+
+            for nprobe in NPROBES:
+                hits, ivf_ms = 0, []
+                for query, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    found, _ = index.search(query, k=K, nprobe=nprobe)
+                    ivf_ms.append((time.perf_counter() - start) * 1000)
+                    hits += len(expected.intersection(found.tolist()))
+                print(f"{n:>9} {build_s:>10.1f} {f'ivf/{nprobe}':>12} {hits / (K * N_QUERIES):>10.3f} "
+                      f"{np.percentile(ivf_ms, 50):>9.2f} {np.percentile(ivf_ms, 99):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Deterministic synthetic Hacker News corpus.
+
+Posts belong to latent topics: titles reuse the topic's keywords and
+embeddings are unit vectors scattered around the topic's centre, so
+clustering, dedup and similarity search see realistic structure. The same
+seed always yields the same corpus, from 1k to 1M posts, generated in
+chunks so memory stays bounded.
+"""
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterator
+
+import numpy as np
+
+from app.repositories.cluster import EMBEDDING_DIM, ClusterRepository
+
+PREFIXES = ["Show HN:", "Ask HN:", "Launch HN:", "", "", "", "", ""]
+WORDS = (
+    "rust python postgres sqlite duckdb kubernetes linux kernel compiler gpu llm transformer "
+    "startup funding layoffs privacy encryption browser firefox chrome apple google microsoft "
+    "openai climate battery solar fusion rocket spacex nasa telescope physics math prime "
+    "economy inflation housing remote work hiring salary interview typescript javascript wasm "
+    "react vim emacs terminal git github outage security breach malware ransomware regulation "
+    "antitrust copyright music video game engine robotics drone car ev tesla chip fab tsmc"
+).split()
+FILLERS = [
+    "is now open source", "in 100 lines", "considered harmful", "explained", "a retrospective",
+    "for fun and profit", "at scale", "from scratch", "released", "benchmarks", "deep dive",
+    "why it matters", "what we learned", "the hard way", "is all you need",
+]
+
+
+def n_topics_for(n_posts: int) -> int:
+    return max(10, n_posts // 500)
+
+
+def topic_centres(n_topics: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n_topics, EMBEDDING_DIM), dtype=np.float32)
+
+
+def generate_embeddings(
+    topics: np.ndarray, centres: np.ndarray, rng: np.random.Generator, noise: float = 1.0
+) -> np.ndarray:
+    """Unit vectors around the centres of the given topics"""
+    vectors = centres[topics] + noise * rng.standard_normal((len(topics), EMBEDDING_DIM), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@lru_cache(maxsize=8)
+def topic_keywords(n_topics: int, seed: int = 0) -> list[list[str]]:
+    rng = np.random.default_rng(seed)
+    return [list(rng.choice(WORDS, 3, replace=False)) for _ in range(n_topics)]
+
+
+def generate_titles(topics: np.ndarray, keywords: list[list[str]], rng: np.random.Generator) -> list[str]:
+    prefixes = rng.choice(PREFIXES, len(topics))
+    fillers = rng.choice(FILLERS, len(topics))
+    picks = rng.integers(0, 3, (len(topics), 2))
+    return [
+        " ".join(part for part in (
+            prefix, keywords[topic][a].capitalize(), keywords[topic][b], filler
+        ) if part)
+        for topic, prefix, filler, (a, b) in zip(topics, prefixes, fillers, picks)
+    ]
+
+
+def story(post_id: int, n_topics: int = 100, seed: int = 0) -> dict:
+    """HN item JSON for one synthetic story, stable across calls"""
+    rng = np.random.default_rng((seed, post_id))
+    topic = int(rng.integers(0, n_topics))
+    title = generate_titles(np.array([topic]), topic_keywords(n_topics, seed), rng)[0]
+    return {
+        "id": post_id,
+        "type": "story",
+        "by": f"user{post_id % 997}",
+        "time": 1_700_000_000 + post_id,
+        "title": title,
+        "url": f"https://example.com/{topic}/{post_id}",
+        "score": int(rng.integers(1, 500)),
+        "descendants": int(rng.integers(0, 300)),
+    }
+
+
+def iter_posts(n_posts: int, chunk_size: int = 50_000, seed: int = 0) -> Iterator[list[dict]]:
+    """Yield insert-ready post records in chunks"""
+    n_topics = n_topics_for(n_posts)
+    centres = topic_centres(n_topics, seed)
+    keywords = topic_keywords(n_topics, seed)
+    created_at = datetime.now()
+    for chunk_idx, start in enumerate(range(0, n_posts, chunk_size)):
+        rng = np.random.default_rng((seed, chunk_idx))
+        size = min(chunk_size, n_posts - start)
+        topics = rng.integers(0, n_topics, size)
+        embeddings = generate_embeddings(topics, centres, rng)
+        titles = generate_titles(topics, keywords, rng)
+        yield [
+            {
+                "title": titles[i],
+                "url": f"https://example.com/{topics[i]}/{start + i}",
+                "hn_post_id": start + i + 1,
+                "embedding": embeddings[i],
+                "created_at": created_at,
+            }
+            for i in range(size)
+        ]
+
+
+def seed_database(repo: ClusterRepository, n_posts: int, chunk_size: int = 50_000, seed: int = 0) -> int:
+    """Create the tables and bulk insert a synthetic corpus; returns the rows inserted"""
+    repo.create_embeddings_table()
+    repo.create_cluster_table()
+    repo.create_cluster_title_table()
+    repo.create_cluster_centroids_table()
+    repo.create_duplicates_table()
+    repo.create_crawl_runs_table()
+    repo.create_indexes()
+    return sum(
+        repo.bulk_insert_into_embeddings_table(chunk)
+        for chunk in iter_posts(n_posts, chunk_size, seed)
+    )
@@ -0,0 +1,152 @@
+"""Local stand-ins for the HN API, the HF Inference API and OpenRouter.
+
+Each endpoint sleeps for a configurable latency before answering, so
+benchmarks can model slow upstreams without touching the network.
+
+Run standalone with: python -m benchmarks.stubs [--port 8765] [--hn-latency 0.05] ...
+and point HN_URL, HF_URL and LLM_URL at the printed URLs.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.config import secrets, settings
+from app.services.embedding import HashingEmbeddingBackend
+
+from . import corpus
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; Nagle would delay the body
+    disable_nagle_algorithm = True
+    server: "_StubHTTPServer"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, body) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        stub = self.server.stub
+        stub.count("hn")
+        time.sleep(stub.hn_latency)
+        if self.path.endswith("/topstories.json"):
+            return self._send(list(range(1, stub.n_posts + 1)))
+        if self.path.endswith("/maxitem.json"):
+            return self._send(stub.n_posts)
+        if self.path.endswith("/updates.json"):
+            return self._send({"items": stub.updated_ids, "profiles": []})
+        if "/item/" in self.path:
+            post_id = int(self.path.rsplit("/", 1)[-1].split(".")[0])
+            return self._send(corpus.story(post_id) if post_id <= stub.n_posts else None)
+        self.send_error(404)
+
+    def do_POST(self) -> None:
+        stub = self.server.stub
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.startswith("/hf"):
+            stub.count("hf")
+            time.sleep(stub.hf_latency)
+            inputs = body["inputs"]
+            texts = inputs if isinstance(inputs, list) else [inputs]
+            embeddings = stub.embedder.embed(texts).tolist()
+            return self._send(embeddings if isinstance(inputs, list) else embeddings[0])
+        if self.path.startswith("/llm"):
+            stub.count("llm")
+            time.sleep(stub.llm_latency)
+            titles = body["messages"][-1]["content"].removeprefix("List of titles: ")
+            title = " ".join(titles.split(",")[0].split()[:4]) or "Untitled"
+            return self._send({"choices": [{"message": {"content": json.dumps({"title": title})}}]})
+        self.send_error(404)
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "StubServer"
+
+
+class StubServer:
+    """HN, HF and LLM stubs on one local port"""
+
+    def __init__(
+        self,
+        n_posts: int = 500,
+        hn_latency: float = 0.0,
+        hf_latency: float = 0.0,
+        llm_latency: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.n_posts = n_posts
+        # Served by updates.json
+        self.updated_ids: list[int] = []
+        self.hn_latency = hn_latency
+        self.hf_latency = hf_latency
+        self.llm_latency = llm_latency
+        self.embedder = HashingEmbeddingBackend()
+        self.requests = {"hn": 0, "hf": 0, "llm": 0}
+        self._requests_lock = threading.Lock()
+        self._server = _StubHTTPServer((host, port), _Handler)
+        self._server.stub = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, service: str) -> None:
+        with self._requests_lock:
+            self.requests[service] += 1
+
+    def configure(self) -> None:
+        """Point the app's endpoints and credentials at this server"""
+        settings["HN_URL"] = f"{self.url}/v0"
+        settings["HF_URL"] = f"{self.url}/hf"
+        settings["LLM_URL"] = f"{self.url}/llm"
+        secrets.setdefault("HF_API_KEY", "stub")
+        secrets.setdefault("OPENROUTER_API_KEY", "stub")
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the HN, HF and LLM stubs")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--hn-latency", type=float, default=0.0)
+    parser.add_argument("--hf-latency", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    args = parser.parse_args()
+    stub = StubServer(args.posts, args.hn_latency, args.hf_latency, args.llm_latency, port=args.port)
+    print(f"HN_URL={stub.url}/v0\nHF_URL={stub.url}/hf\nLLM_URL={stub.url}/llm")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""End-to-end benchmark suite against local stubs and a synthetic corpus.
+
+Measures crawl throughput, insert rate, clustering time, titling time,
+/hotnews render latency and bot startup (see bench_startup.py). Every run appends one JSON line per corpus size
+to benchmarks/results.jsonl, tagged with the git revision, and prints the
+change against the previous run of the same size.
+
+Run with: python -m benchmarks.suite [--sizes 1000 10000 100000 1000000]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app.config import settings
+from app.infrastructure import duckdb_connection
+from app.repositories.cluster import ClusterRepository
+from app.services import (cluster, crawler, dedup, payload_cache, telegram,
+                          vector_index)
+
+from . import corpus
+from .bench_startup import bench_startup
+from .stubs import StubServer
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+DEFAULT_SIZES = [1000, 10000]
+RENDER_REPEATS = 1000
+
+
+def _use_database(path: str) -> ClusterRepository:
+    """Point every service at a fresh database file"""
+    repo = ClusterRepository(path)
+    for module in (cluster, crawler, dedup, vector_index):
+        module.cluster_repo = repo
+    vector_index._index = None
+    return repo
+
+
+def _timed(fn, *args, **kwargs) -> tuple:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def bench_crawl(tmp_dir: str, stub: StubServer, n_posts: int) -> dict:
+    repo = _use_database(os.path.join(tmp_dir, "crawl.duckdb"))
+    corpus.seed_database(repo, 0)
+    settings["CRAWL_LIMIT"] = n_posts
+    settings["CRAWL_RATE_LIMIT"] = 10_000
+    stats, seconds = _timed(crawler.fetch_and_insert, incremental=False)
+    return {
+        "crawl_posts": stats.n_inserted,
+        "crawl_s": round(seconds, 3),
+        "crawl_posts_per_s": round(stats.n_inserted / seconds, 1),
+    }
+
+
+def bench_size(tmp_dir: str, n_posts: int) -> dict:
+    db_path = os.path.join(tmp_dir, f"corpus_{n_posts}.duckdb")
+    repo = _use_database(db_path)
+    inserted, insert_s = _timed(corpus.seed_database, repo, n_posts)
+    _, fit_s = _timed(cluster.fit_clusters, auto=False)
+
+    cluster_idxs = list(range(settings["N_CLUSTERS"]))
+    # Titles are cached by membership; start from none to time the LLM fan-out
+    repo.clear_cluster_titles()
+    _, titling_s = _timed(cluster.generate_cluster_titles, cluster_idxs)
+
+    # Cold: the eager rebuild that follows a clustering run, then the first read
+    _, rebuild_s = _timed(payload_cache.invalidate)
+    _, first_s = _timed(telegram.get_telegram_hot_news)
+    cold_s = rebuild_s + first_s
+    warm = []
+    for _ in range(RENDER_REPEATS):
+        _, seconds = _timed(telegram.get_telegram_hot_news)
+        warm.append(seconds)
+    # Startup runs in fresh interpreters, which need the file lock
+    duckdb_connection.close_all()
+    return {
+        "insert_rows_per_s": round(inserted / insert_s, 1),
+        "cluster_fit_s": round(fit_s, 3),
+        "titling_s": round(titling_s, 3),
+        "hotnews_cold_ms": round(cold_s * 1000, 3),
+        "hotnews_warm_p50_us": round(float(np.percentile(warm, 50)) * 1e6, 2),
+        "hotnews_warm_p99_us": round(float(np.percentile(warm, 99)) * 1e6, 2),
+        **bench_startup(db_path, tmp_dir),
+    }
+
+
+def _previous_results(path: str) -> dict[int, dict]:
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                previous[record["n_posts"]] = record
+    return previous
+
+
+def _print_comparison(record: dict, previous: dict | None) -> None:
+    print(f"\n{record['n_posts']} posts @ {record['git_revision']}"
+          + (f" (vs {previous['git_revision']})" if previous else ""))
+    for name, value in record["metrics"].items():
+        line = f"  {name:<22} {value:>14}"
+        old = previous["metrics"].get(name) if previous else None
+        if old:
+            line += f"  {(value - old) / old * 100:+7.1f}%"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--crawl", type=int, default=500, help="posts fetched through the HN/HF stubs")
+    parser.add_argument("--hn-latency", type=float, default=0.02)
+    parser.add_argument("--hf-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    previous = _previous_results(args.results)
+    revision = _git_revision()
+    with tempfile.TemporaryDirectory() as tmp_dir, StubServer(
+        n_posts=args.crawl,
+        hn_latency=args.hn_latency,
+        hf_latency=args.hf_latency,
+        llm_latency=args.llm_latency,
+    ) as stub:
+        stub.configure()
+        settings["ARTIFACT_DIR"] = tmp_dir
+        settings["SNAPSHOT_PATH"] = None
+        crawl_metrics = bench_crawl(tmp_dir, stub, args.crawl)
+
+        for n_posts in args.sizes:
+            record = {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "git_revision": revision,
+                "python": platform.python_version(),
+                "machine": f"{platform.machine()} x{os.cpu_count()}",
+                "n_posts": n_posts,
+                "latency": {"hn": args.hn_latency, "hf": args.hf_latency, "llm": args.llm_latency},
+                "metrics": {**crawl_metrics, **bench_size(tmp_dir, n_posts)},
+            }
+            _print_comparison(record, previous.get(n_posts))
+            if not args.no_save:
+                with open(args.results, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+    if not args.no_save:
+        print(f"\nResults appended to {args.results}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
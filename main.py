@@ -1,14 +1,20 @@
-import asyncio
+import html
+import re
 
 from telegram import InlineKeyboardMarkup, Update
 from telegram.ext import (Application, CallbackQueryHandler, CommandHandler,
                           ContextTypes, MessageHandler, filters)
 
 from app.config import secrets, settings
+from app.infrastructure import metrics
+from app.infrastructure.executor import (SingleFlight, background_executor,
+                                         run_blocking)
 from app.logger import setup_logger
 from app.repositories.cluster import ClusterRepository
-from app.services import crawler
-from app.services.telegram import (get_telegram_cluster_posts,
+from app.services import (cli, cluster_worker, payload_cache, retention,
+                          scheduler, vector_index)
+from app.services.telegram import (HOT_NEWS_KEY, format_similar_posts,
+                                   get_telegram_cluster_posts,
                                    get_telegram_hot_news,
                                    handle_telegram_callback)
 
@@ -16,15 +22,36 @@ logger = setup_logger(__name__)
 
 cluster_repo = ClusterRepository()
 
+# Concurrent requests for the same payload share one rebuild
+single_flight = SingleFlight()
+
+# Telegram user ids allowed to run admin commands, comma separated in .env
+admin_user_ids = {
+    int(user_id) for user_id in (secrets.get("TELEGRAM_ADMIN_IDS") or "").split(",") if user_id.strip()
+}
+
+async def render_payload(key: str, fn, *args) -> dict:
+    """Answer from the payload cache on the loop, or rebuild it once off the loop."""
+    # One read: after a separate freshness check, an invalidate() from the
+    # background thread could make fn rebuild from DuckDB on the event loop
+    payload = payload_cache.get(key)
+    if payload is not None:
+        return payload
+    return await single_flight.do(key, fn, *args)
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /start command."""
-    welcome_text = "Welcome to TinySignal Bot!\n\nUse /hotnews to see trending news clusters from Hacker News."
+    welcome_text = (
+        "Welcome to TinySignal Bot!\n\nUse /hotnews to see trending news clusters from Hacker News."
+        "\nUse /similar <post id or HN link> to find related posts."
+    )
     await update.message.reply_text(welcome_text)
 
+@metrics.timed("telegram.hotnews")
 async def hot_news_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /hotnews command to display trending clusters."""
     try:
-        response = get_telegram_hot_news()
+        response = await render_payload(HOT_NEWS_KEY, get_telegram_hot_news)
         await update.message.reply_text(
             text=response["text"],
             reply_markup=InlineKeyboardMarkup(response["reply_markup"]["inline_keyboard"])
@@ -33,23 +60,118 @@ async def hot_news_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         logger.error(f"Error in hot_news_command: {e}", exc_info=True)
         await update.message.reply_text("❌ Error fetching hot news. Please try again later.")
 
+def parse_post_id(arg: str) -> int | None:
+    """Accept a bare HN id or an item?id= link."""
+    match = re.search(r"(?:id=)?(\d+)\s*$", arg)
+    return int(match.group(1)) if match else None
+
+@metrics.timed("telegram.similar")
+async def similar_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /similar command to list posts related to an HN post."""
+    hn_post_id = parse_post_id(context.args[0]) if context.args else None
+    if hn_post_id is None:
+        await update.message.reply_text("Usage: /similar <post id or HN link>")
+        return
+    try:
+        posts = await run_blocking(vector_index.similar_posts, hn_post_id)
+        response = format_similar_posts(hn_post_id, posts)
+        await update.message.reply_text(
+            text=response["text"],
+            reply_markup=InlineKeyboardMarkup(response["reply_markup"]["inline_keyboard"])
+        )
+    except Exception as e:
+        logger.error(f"Error in similar_command: {e}", exc_info=True)
+        await update.message.reply_text("❌ Error finding similar posts. Please try again later.")
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the admin-only /stats command with per-stage latencies."""
+    if update.effective_user is None or update.effective_user.id not in admin_user_ids:
+        await update.message.reply_text("This command is restricted to admins.")
+        return
+    await update.message.reply_text(f"<pre>{html.escape(metrics.format_stats())}</pre>", parse_mode="HTML")
+
+async def snapshot_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the admin-only /snapshot command, exporting from the running bot."""
+    if update.effective_user is None or update.effective_user.id not in admin_user_ids:
+        await update.message.reply_text("This command is restricted to admins.")
+        return
+    try:
+        counts = await run_blocking(cli.export_snapshot, settings["SNAPSHOT_PATH"], executor=background_executor)
+        await update.message.reply_text(f"Exported snapshot to {settings['SNAPSHOT_PATH']}: {counts}")
+    except Exception as e:
+        logger.error(f"Error in snapshot_command: {e}", exc_info=True)
+        await update.message.reply_text("❌ Error exporting the snapshot.")
+
+async def metrics_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Write the Prometheus textfile for node_exporter."""
+    try:
+        await run_blocking(metrics.write_textfile)
+    except Exception as e:
+        logger.error(f"Error writing metrics: {e}", exc_info=True)
+
 async def scheduled_crawler(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Run crawler job every hour."""
+    """Crawl, recluster when enough posts changed, and schedule the next run."""
     try:
-        logger.info("Running scheduled crawler job...")
-        # crawler.fetch_and_insert() is sync, so run in thread pool
-        await asyncio.get_event_loop().run_in_executor(None, crawler.fetch_and_insert)
-        logger.info("Scheduled crawler job completed")
+        if scheduler.is_running():
+            logger.info("Previous crawl is still running, skipping this one")
+        else:
+            logger.info("Running scheduled crawler job...")
+            # Crawling and clustering block, so they run in the background executor
+            await run_blocking(scheduler.run_once, executor=background_executor)
+            logger.info("Scheduled crawler job completed")
     except Exception as e:
         logger.error(f"Error in scheduled crawler: {e}", exc_info=True)
+    finally:
+        # Rescheduled after each run so the jitter differs every time
+        context.job_queue.run_once(scheduled_crawler, when=scheduler.next_delay())
 
+async def warmup_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Render the hot news payloads from the database once polling has started."""
+    try:
+        # Shares the rebuild with any /hotnews that arrives while it runs
+        await render_payload(HOT_NEWS_KEY, get_telegram_hot_news)
+    except Exception as e:
+        logger.error(f"Error in warm-up job: {e}", exc_info=True)
+
+async def index_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Load or build the similarity index off the request path; /similar never builds it."""
+    try:
+        await run_blocking(vector_index.sync_index, executor=background_executor)
+    except Exception as e:
+        logger.error(f"Error in index job: {e}", exc_info=True)
+
+async def cluster_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Cluster posts stored since the last run, off the request path, if enough changed."""
+    try:
+        # Same lock and thresholds as the crawl, so the two never cluster at once
+        await run_blocking(scheduler.recluster_if_needed, executor=background_executor)
+    except Exception as e:
+        logger.error(f"Error in cluster job: {e}", exc_info=True)
+
+async def snapshot_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Back up the database to SNAPSHOT_PATH without stopping the bot."""
+    try:
+        await run_blocking(cli.export_snapshot, settings["SNAPSHOT_PATH"], executor=background_executor)
+    except Exception as e:
+        logger.error(f"Error in snapshot job: {e}", exc_info=True)
+
+async def retention_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Archive posts past the retention period to Parquet."""
+    try:
+        await run_blocking(retention.archive_old_posts, executor=background_executor)
+    except Exception as e:
+        logger.error(f"Error in retention job: {e}", exc_info=True)
+
+@metrics.timed("telegram.callback")
 async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle callback queries from inline buttons."""
     query = update.callback_query
     await query.answer()  # Acknowledge the callback query
     
     try:
-        response = handle_telegram_callback(query.data)
+        # "Back" shows the hot news payload, cached under its own key
+        key = HOT_NEWS_KEY if query.data == "back_to_clusters" else query.data
+        response = await render_payload(key, handle_telegram_callback, query.data)
         await query.edit_message_text(
             text=response["text"],
             reply_markup=InlineKeyboardMarkup(response["reply_markup"]["inline_keyboard"])
@@ -61,31 +183,58 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
 async def shutdown_handler(app: Application) -> None:
     """Handle graceful shutdown."""
     logger.info("Shutting down bot...")
-    # Add any cleanup code here if needed
+    cluster_worker.shutdown()
 
 def init_app():
-    if not cluster_repo.is_persistent_path_exists():
-        cluster_repo.create_embeddings_table()
-        cluster_repo.create_cluster_table()
-        cluster_repo.create_cluster_title_table()
+    # All DDL is idempotent, so it runs on every start
+    cluster_repo.create_embeddings_table()
+    cluster_repo.create_cluster_table()
+    cluster_repo.create_cluster_title_table()
+    cluster_repo.create_cluster_centroids_table()
+    cluster_repo.create_crawl_runs_table()
+    cluster_repo.create_duplicates_table()
+    cluster_repo.create_indexes()
+    # A fresh database is seeded from SNAPSHOT_PATH instead of re-crawling
+    if cli.import_snapshot_if_empty():
+        logger.info(f"Seeded the database from {settings['SNAPSHOT_PATH']}")
 
 def main():
     assert "TELEGRAM_BOT_TOKEN" in secrets.keys(), "Missing TELEGRAM_BOT_TOKEN."
     
     init_app()
     
-    application = Application.builder().token(secrets["TELEGRAM_BOT_TOKEN"]).build()
+    application = (
+        Application.builder().token(secrets["TELEGRAM_BOT_TOKEN"]).post_shutdown(shutdown_handler).build()
+    )
     job_queue = application.job_queue
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("hotnews", hot_news_command))
+    application.add_handler(CommandHandler("similar", similar_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("snapshot", snapshot_command))
     
     # Add callback handler for inline buttons
     application.add_handler(CallbackQueryHandler(button_callback_handler))
     
-    # Schedule crawler job every hour
-    # job_queue.run_repeating(scheduled_crawler, interval=3600, first=10)
+    # Prefill the payload cache, then cluster whatever is already stored, without blocking startup
+    job_queue.run_once(warmup_job, when=0)
+    job_queue.run_once(index_job, when=0)
+    job_queue.run_once(cluster_job, when=0)
+
+    # Keep the live database to the retention period
+    job_queue.run_repeating(retention_job, interval=settings["RETENTION_INTERVAL"], first=60)
+
+    # The CLI cannot open the database while the bot holds it, so backups run in-process
+    if settings["SNAPSHOT_PATH"] and settings["SNAPSHOT_INTERVAL"]:
+        job_queue.run_repeating(snapshot_job, interval=settings["SNAPSHOT_INTERVAL"], first=settings["SNAPSHOT_INTERVAL"])
+
+    if settings["METRICS_ENABLED"]:
+        job_queue.run_repeating(metrics_job, interval=settings["METRICS_INTERVAL"], first=settings["METRICS_INTERVAL"])
+
+    # Crawl every CRAWL_INTERVAL (with jitter), reclustering only when enough changed
+    job_queue.run_once(scheduled_crawler, when=10)
     
     try:
         logger.info("Starting bot with job queue...")